@@ -10,13 +10,15 @@ from roach.hash.crc import crc32
 from roach.hash.sha import md5, sha1, sha224, sha384, sha256, sha512
 from roach.string.inet import ipv4
 from roach.string.ops import asciiz, hex, unhex, uleb128
+from roach.string.scan import Scanner
 from roach.structure import Structure
 
 from roach.pe import pe2procmem
 
 from roach.procmem import (
     PAGE_READONLY, PAGE_READWRITE, PAGE_WRITECOPY, PAGE_EXECUTE,
-    PAGE_EXECUTE_READ, PAGE_EXECUTE_READWRITE, PAGE_EXECUTE_WRITECOPY
+    PAGE_EXECUTE_READ, PAGE_EXECUTE_READWRITE, PAGE_EXECUTE_WRITECOPY,
+    MEM_COMMIT, MEM_RESERVE, MEM_FREE, MEM_PRIVATE, MEM_MAPPED, MEM_IMAGE
 )
 
 from roach.short import (
@@ -0,0 +1,176 @@
+# Copyright (C) 2018 Jurriaan Bremer.
+# This file is part of Roach - https://github.com/jbremer/roach.
+# See the file 'docs/LICENSE.txt' for copying permission.
+
+import array
+import collections
+import os
+import struct
+import threading
+import zlib
+
+try:
+    import zstandard
+    HAVE_ZSTD = True
+except ImportError:
+    HAVE_ZSTD = False
+
+# Header: magic, version, codec, block size, raw size, block count, offset of
+# the block index. The block index holds the offset of each compressed block
+# followed by the offset of the block index itself.
+HEADER = "=4sIIIQQQ"
+MAGIC = b"RBLK"
+VERSION = 1
+
+CODEC_ZLIB = 0
+CODEC_ZSTD = 1
+
+codecs = {
+    "zlib": CODEC_ZLIB,
+    "zstd": CODEC_ZSTD,
+}
+
+def _compressor(codec, level):
+    if codec == CODEC_ZLIB:
+        return lambda buf: zlib.compress(buf, level)
+    if not HAVE_ZSTD:
+        raise RuntimeError("zstd compression requires zstandard!")
+    return zstandard.ZstdCompressor(level=level).compress
+
+def _decompressor(codec):
+    if codec == CODEC_ZLIB:
+        return zlib.decompress
+    if not HAVE_ZSTD:
+        raise RuntimeError("zstd compression requires zstandard!")
+    return zstandard.ZstdDecompressor().decompress
+
+def detect(f):
+    """Checks whether a file object holds a block-compressed file."""
+    try:
+        offset = f.tell()
+        magic = f.read(len(MAGIC))
+        f.seek(offset)
+    except (AttributeError, IOError, OSError, ValueError):
+        return False
+    return magic == MAGIC
+
+def compress(src, dst, codec="zlib", block_size=0x100000, level=6):
+    """Compresses a file, e.g., a process memory dump, into independently
+    compressed blocks so that it may be read at random offsets."""
+    fin = src if hasattr(src, "read") else open(src, "rb")
+    fout = dst if hasattr(dst, "write") else open(dst, "wb")
+    compressor = _compressor(codecs[codec], level)
+
+    start = fout.tell()
+    fout.write(b"\x00" * struct.calcsize(HEADER))
+
+    offsets, size = array.array("Q"), 0
+    while True:
+        buf = fin.read(block_size)
+        if not buf:
+            break
+        offsets.append(fout.tell() - start)
+        fout.write(compressor(buf))
+        size += len(buf)
+
+    index = fout.tell() - start
+    offsets.append(index)
+    fout.write(offsets.tobytes())
+
+    fout.seek(start)
+    fout.write(struct.pack(
+        HEADER, MAGIC, VERSION, codecs[codec], block_size, size,
+        len(offsets) - 1, index
+    ))
+    fout.seek(0, os.SEEK_END)
+
+    if fin is not src:
+        fin.close()
+    if fout is not dst:
+        fout.close()
+
+class BlockFile(object):
+    """Read-only file object on top of a block-compressed file. Recently
+    used blocks are kept around decompressed in a LRU cache."""
+
+    def __init__(self, file_or_filepath, cache=64):
+        if hasattr(file_or_filepath, "read"):
+            self.f = file_or_filepath
+        else:
+            self.f = open(file_or_filepath, "rb")
+
+        # Offsets within the file are relative to the start of the header.
+        self.base = self.f.tell()
+
+        buf = self.f.read(struct.calcsize(HEADER))
+        if len(buf) != struct.calcsize(HEADER):
+            raise RuntimeError("not a block-compressed file!")
+
+        magic, version, codec, self.block_size, self.size, count, index = (
+            struct.unpack(HEADER, buf)
+        )
+        if magic != MAGIC or version != VERSION:
+            raise RuntimeError("not a block-compressed file!")
+
+        self.decompress = _decompressor(codec)
+
+        self.f.seek(self.base + index)
+        self.offsets = array.array("Q")
+        self.offsets.frombytes(self.f.read(8 * (count + 1)))
+        if len(self.offsets) != count + 1:
+            raise RuntimeError("truncated block-compressed file!")
+
+        self.cache = collections.OrderedDict()
+        self.cache_size = cache
+        self.lock = threading.Lock()
+        self.position = 0
+
+    def block(self, idx):
+        """Returns the decompressed contents of a block."""
+        with self.lock:
+            if idx in self.cache:
+                self.cache.move_to_end(idx)
+                return self.cache[idx]
+
+            self.f.seek(self.base + self.offsets[idx])
+            buf = self.decompress(
+                self.f.read(self.offsets[idx+1] - self.offsets[idx])
+            )
+
+            self.cache[idx] = buf
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            return buf
+
+    def pread(self, length, offset):
+        """Reads length bytes at offset without touching the file position,
+        similar to os.pread()."""
+        length = max(min(length, self.size - offset), 0)
+        ret = []
+        while length:
+            idx, skip = divmod(offset, self.block_size)
+            buf = self.block(idx)[skip:skip+length]
+            ret.append(buf)
+            offset, length = offset + len(buf), length - len(buf)
+        return b"".join(ret)
+
+    def read(self, length=-1):
+        if length is None or length < 0:
+            length = self.size - self.position
+        buf = self.pread(length, self.position)
+        self.position += len(buf)
+        return buf
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self.position = offset
+        return offset
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        self.f.close()
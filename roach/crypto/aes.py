@@ -2,7 +2,9 @@
 # This file is part of Roach - https://github.com/jbremer/roach.
 # See the file 'docs/LICENSE.txt' for copying permission.
 
+from builtins import int, bytes, range
 import io
+import re
 
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
@@ -35,6 +37,110 @@ BlobTypes = {
     8: PlaintextKeyBlob,
 }
 
+def _xtime(x):
+    return (x << 1 ^ (0x1b if x & 0x80 else 0)) & 0xff
+
+def _sbox():
+    """Computes the AES S-box from the multiplicative inverse in GF(2^8)."""
+    sbox, p, q = [0x63] * 256, 1, 1
+    while True:
+        p = p ^ _xtime(p)
+        q ^= q << 1
+        q ^= q << 2
+        q ^= q << 4
+        q = (q ^ (0x09 if q & 0x80 else 0)) & 0xff
+        x = q
+        for shift in range(1, 5):
+            x ^= (q << shift | q >> (8 - shift)) & 0xff
+        sbox[p] = x ^ 0x63
+        if p == 1:
+            return sbox
+
+sbox = _sbox()
+
+def expand_key(key):
+    """Expands an AES-128, AES-192, or AES-256 key into its round keys."""
+    if len(key) not in (16, 24, 32):
+        raise RuntimeError("invalid AES key size!")
+
+    nk, rcon, w = len(key) // 4, 1, bytearray(key)
+    for idx in range(nk, 4 * (nk + 7)):
+        t = w[-4:]
+        if idx % nk == 0:
+            t = bytearray((
+                sbox[t[1]] ^ rcon, sbox[t[2]], sbox[t[3]], sbox[t[0]]
+            ))
+            rcon = _xtime(rcon)
+        elif nk == 8 and idx % nk == 4:
+            t = bytearray(sbox[x] for x in t)
+        prev = w[-4*nk:len(w)-4*nk+4]
+        w.extend(a ^ b for a, b in zip(prev, t))
+    return bytes(w)
+
+def _schedule_regex(nk):
+    """Regex of the words in a key schedule xor'ed with itself shifted by
+    nk words and by one word, which are zero unless SubWord() is involved
+    for them, i.e., for words that are not a multiple of nk (or nk / 2 for
+    AES-256) in the schedule."""
+    ret = []
+    for idx in range(nk, 4 * (nk + 7)):
+        if idx % nk == 0 or (nk == 8 and idx % nk == 4):
+            ret.append(b"(?!\\x00{4})[\\s\\S]{4}")
+        else:
+            ret.append(b"\\x00{4}")
+    return re.compile(b"".join(ret))
+
+_nonzero = re.compile(b"[^\\x00]")
+
+schedules = dict((nk * 4, _schedule_regex(nk)) for nk in (4, 6, 8))
+
+def find_key_schedules(buf, offset=0):
+    """Finds expanded AES key schedules in a buffer and returns a list of
+    (offset, key). Within a schedule, most bytes equal the xor of the byte
+    one key length earlier and the byte one word earlier. Xor'ing the
+    buffer with itself shifted accordingly yields zeroes for those bytes,
+    i.e., short runs of zeroes in between non-zero words. Only offsets
+    preceding such runs are matched against the full schedule pattern and
+    verified through key expansion. Longer runs of zeroes, e.g., zero
+    pages, are skipped altogether."""
+    length, value, ret = len(buf), int.from_bytes(buf, "little"), []
+    shifted = value ^ value >> 32
+    for keylen, regex in sorted(schedules.items()):
+        size = 4 * (keylen + 28)
+        if length < size:
+            continue
+
+        delta = (
+            value ^ shifted >> 8 * (keylen - 4)
+        ).to_bytes(length, "little")
+
+        start = delta.find(b"\x00" * 12)
+        while start != -1:
+            # Skip over zero pages in large steps.
+            end = start
+            while delta.count(b"\x00", end, end + 0x1000) == 0x1000:
+                end += 0x1000
+            end = _nonzero.search(delta, end)
+            end = end.start() if end else length
+
+            # A schedule never has more than 26 zeroes in a row.
+            if end - start <= 26:
+                for off in range(max(start - 4, 0), start):
+                    if off + size > length or not regex.match(delta, off):
+                        continue
+
+                    # Quick check of the first byte of the first SubWord().
+                    if buf[off+keylen] != (
+                        buf[off] ^ sbox[buf[off+keylen-3]] ^ 1
+                    ):
+                        continue
+
+                    key = bytes(buf[off:off+keylen])
+                    if expand_key(key) == buf[off:off+size]:
+                        ret.append((offset + off, key))
+            start = delta.find(b"\x00" * 12, end)
+    return sorted(ret)
+
 class AES(object):
     algorithms = (
         0x0000660e,  # AES 128
@@ -57,6 +163,13 @@ class AES(object):
     def decrypt(self, data):
         return self.aes.update(data) + self.aes.finalize()
 
+    def update(self, data):
+        """Decrypts the next chunk of a stream of data."""
+        return self.aes.update(data)
+
+    def finalize(self):
+        return self.aes.finalize()
+
     @staticmethod
     def import_key(data):
         if len(data) < BLOBHEADER.sizeof():
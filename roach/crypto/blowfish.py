@@ -14,3 +14,10 @@ class Blowfish(object):
 
     def decrypt(self, data):
         return self.blowfish.update(data) + self.blowfish.finalize()
+
+    def update(self, data):
+        """Decrypts the next chunk of a stream of data."""
+        return self.blowfish.update(data)
+
+    def finalize(self):
+        return self.blowfish.finalize()
@@ -18,3 +18,10 @@ class DES3(object):
 
     def decrypt(self, data):
         return self.des3.update(data) + self.des3.finalize()
+
+    def update(self, data):
+        """Decrypts the next chunk of a stream of data."""
+        return self.des3.update(data)
+
+    def finalize(self):
+        return self.des3.finalize()
@@ -0,0 +1,306 @@
+# Copyright (C) 2018 Jurriaan Bremer.
+# This file is part of Roach - https://github.com/jbremer/roach.
+# See the file 'docs/LICENSE.txt' for copying permission.
+
+from builtins import int, bytes, range
+import array
+import bisect
+import collections
+import functools
+import itertools
+import math
+import operator
+import re
+import struct
+
+from roach.crypto.aes import AES
+from roach.crypto.rsa import RSA
+from roach.string.bin import uint32
+
+# CryptoAPI BLOBHEADER structures with a matching bType and aiKeyAlg, i.e.,
+# a PLAINTEXTKEYBLOB holding an AES key, or a PUBLICKEYBLOB or
+# PRIVATEKEYBLOB holding a RSA key.
+BLOB = (
+    b"\\x08\\x02\\x00\\x00[\\x0e\\x0f\\x10]\\x66\\x00\\x00|"
+    b"[\\x06\\x07]\\x02\\x00\\x00\\x00\\xa4\\x00\\x00"
+)
+
+PEM = (
+    b"-----BEGIN (?:RSA )?(?:PUBLIC|PRIVATE) KEY-----"
+    b"[A-Za-z0-9+/=\\r\\n\\x20:,-]{64,8192}?"
+    b"-----END (?:RSA )?(?:PUBLIC|PRIVATE) KEY-----"
+)
+
+# DER encoded sequences, with a one or two byte length, of a PKCS#1 private
+# key, a PKCS#8 private key, a SubjectPublicKeyInfo, or a PKCS#1 public key.
+RSA_OID = b"\\x30\\x0d\\x06\\x09\\x2a\\x86\\x48\\x86\\xf7\\x0d\\x01\\x01\\x01"
+DER = (
+    b"\\x30(?:\\x81.|\\x82..)(?:\\x02\\x01\\x00\\x02[\\x81\\x82]|"
+    b"\\x02\\x01\\x00" + RSA_OID + b"|" + RSA_OID + b"|\\x02[\\x81\\x82])"
+)
+
+regex = re.compile(
+    b"(?P<blob>%s)|(?P<pem>%s)|(?P<der>%s)" % (BLOB, PEM, DER), re.DOTALL
+)
+
+printable = bytes(bytearray(range(0x20, 0x7f))) + b"\t\r\n"
+
+# Bytes that are common in x86 code and data structures, with their weight
+# towards a window not being random: 0x00, 0xff, 0x8b (mov), and, to a
+# lesser extent, small values and common opcodes. Other bytes weigh -1.
+weights = [
+    (b"\x00", 5), (b"\xff", 4), (b"\x8b", 3), (bytes(bytearray(
+        list(range(0x01, 0x11)) + list(range(0x50, 0x58)) + [
+            0x24, 0x33, 0x3b, 0x40, 0x45, 0x4d, 0x68, 0x6a, 0x74, 0x75,
+            0x83, 0x84, 0x85, 0x89, 0x8d, 0x90, 0xc0, 0xc3, 0xc7, 0xcc,
+            0xe8, 0xe9, 0xeb, 0xec,
+        ]
+    )), 1),
+]
+
+# Probability with which a random key is rejected by each of the checks.
+alpha = 0.001
+
+_thresholds = {}
+
+def _tail(dist):
+    """Returns the smallest value that a distribution, a dictionary of
+    value to probability, exceeds with a probability below alpha."""
+    tail = 0
+    for value in sorted(dist, reverse=True):
+        if tail + dist[value] >= alpha:
+            return value
+        tail += dist[value]
+
+def _threshold(size):
+    """Returns the maximum number of repeated bytes, of printable bytes,
+    and the maximum score, that a random window of size bytes exceeds with
+    a probability below alpha. The first is approximated by the birthday
+    problem, the others follow from their exact distributions."""
+    if size in _thresholds:
+        return _thresholds[size]
+
+    # Repeated bytes are roughly Poisson distributed.
+    lam = size * (size - 1) / 512.0
+    repeats = [math.exp(-lam)]
+    for count in range(1, size):
+        repeats.append(repeats[-1] * lam / count)
+
+    chance = len(printable) / 256.0
+    printables = [
+        math.factorial(size) // math.factorial(count) //
+        math.factorial(size - count) *
+        chance ** count * (1 - chance) ** (size - count)
+        for count in range(size + 1)
+    ]
+
+    outcomes = [(weight, len(chars) / 256.0) for chars, weight in weights]
+    outcomes.append((-1, 1 - sum(prob for _, prob in outcomes)))
+    scores = {0: 1.0}
+    for _ in range(size):
+        scores_ = collections.defaultdict(float)
+        for score, prob in scores.items():
+            for weight, prob_ in outcomes:
+                scores_[score + weight] += prob * prob_
+        scores = scores_
+
+    _thresholds[size] = ret = (
+        _tail(dict(enumerate(repeats))), _tail(dict(enumerate(printables))),
+        _tail(scores),
+    )
+    return ret
+
+# Per byte, whether it is printable, and its weight plus one, so that both
+# the printable bytes and the score of a window follow from a sum of bytes.
+_printables = bytes(bytearray(
+    int(ch in bytearray(printable)) for ch in range(256)
+))
+_scores = bytearray(256)
+for chars, weight in weights:
+    for ch in bytearray(chars):
+        _scores[ch] = weight + 1
+_scores = bytes(_scores)
+
+def _sums(buf, table, step):
+    """Returns the running sums of the translated buffer at every step
+    bytes, i.e., the sum of the first idx * step bytes at index idx."""
+    ret = array.array("L", [0])
+    ret.extend(itertools.islice(
+        itertools.accumulate(buf.translate(table)), step - 1, None, step
+    ))
+    return ret
+
+def _likely(sums, step, size, align):
+    """Returns, for each aligned offset, whether the window of size bytes
+    passes the byte statistics checks of _random(), i.e., all but the one
+    on repeated bytes, as a byte string of ones and zeroes."""
+    _, printables, score = _threshold(size)
+    a, w = align // step, size // step
+    return bytes(map(
+        operator.and_,
+        map(operator.le, map(
+            operator.sub, sums[0][w::a], sums[0][::a]
+        ), itertools.repeat(printables)),
+        map(operator.le, map(
+            operator.sub, sums[1][w::a], sums[1][::a]
+        ), itertools.repeat(score + size)),
+    ))
+
+def _random(buf, off, size, sums, step):
+    """Checks whether a window is indistinguishable from random bytes, i.e.,
+    it has few repeated bytes, isn't mostly text, and doesn't look like code
+    or small values. The printable bytes and score of a window are taken
+    from the running sums over the buffer, see _sums()."""
+    repeats, printables, score = _threshold(size)
+    lo, hi = off // step, (off + size) // step
+    if sums[0][hi] - sums[0][lo] > printables:
+        return False
+    if sums[1][hi] - sums[1][lo] - size > score:
+        return False
+    return size - len(set(buf[off:off+size])) <= repeats
+
+class Candidate(object):
+    """Key candidate at a given address. type_ is one of "blob", "pem",
+    "der", or "raw"; for RSA keys the key is exported in PEM format."""
+
+    __slots__ = "addr", "type_", "algorithm", "key"
+
+    def __init__(self, addr, type_, algorithm, key):
+        self.addr = addr
+        self.type_ = type_
+        self.algorithm = algorithm
+        self.key = key
+
+    def __eq__(self, other):
+        return (
+            self.addr == other.addr and self.type_ == other.type_ and
+            self.algorithm == other.algorithm and self.key == other.key
+        )
+
+    def __repr__(self):
+        return "<Candidate 0x%08x %s %s>" % (
+            self.addr, self.type_, self.algorithm
+        )
+
+def _import_rsa(data):
+    try:
+        return RSA.import_key(bytes(data))
+    except (ValueError, IndexError, TypeError):
+        pass
+
+def _blob(buf, start):
+    """Returns the algorithm, key, and size of a key blob."""
+    if buf[start:start+1] == b"\x08":
+        length = uint32(bytes(buf[start+8:start+12]))
+        if length not in (16, 24, 32):
+            return
+        ret = AES.import_key(bytes(buf[start:start+12+length]))
+        if ret:
+            return ret[0], ret[1], 12 + length
+        return
+
+    # The remainder of the blob is parsed by RSA.import_key() as far as
+    # required by its bit size.
+    bitsize = uint32(bytes(buf[start+12:start+16])) or 0
+    if bitsize < 256 or bitsize > 16384 or bitsize % 8:
+        return
+    size = 20 + bitsize // 8
+    if buf[start:start+1] == b"\x07":
+        size += bitsize * 9 // 16 - bitsize // 8
+    key = _import_rsa(buf[start:start+size])
+    if key:
+        return "RSA", key, size
+
+def _der(buf, start):
+    """Returns the key and size of a DER encoded RSA key."""
+    if buf[start+1:start+2] == b"\x81":
+        size = 3 + ord(bytes(buf[start+2:start+3]))
+    else:
+        size = 4 + struct.unpack(">H", bytes(buf[start+2:start+4]))[0]
+    key = _import_rsa(buf[start:start+size])
+    if key:
+        return "RSA", key, size
+
+def _raw(buf, offset, sizes, align):
+    """Yields, for each stretch of aligned windows that look random, see
+    _random(), the largest key-sized window at its first offset. Longer
+    stretches, e.g., compressed data, thus yield a single candidate.
+    Adjacent equal bytes are rare in random data, so windows are only
+    considered within runs that contain no more than isolated pairs of
+    them, which are found by xor'ing the buffer with itself shifted by one
+    byte. The byte statistics of the smallest window at each aligned offset
+    are computed up front over the whole buffer, see _likely()."""
+    if len(buf) < 2:
+        return
+
+    buf = bytes(buf)
+    delta = (
+        int.from_bytes(buf[1:], "little") ^ int.from_bytes(buf[:-1], "little")
+    ).to_bytes(len(buf) - 1, "little")
+
+    minsize = min(sizes)
+    step = functools.reduce(math.gcd, sizes, align)
+    sums = _sums(buf, _printables, step), _sums(buf, _scores, step)
+    likely = _likely(sums, step, minsize, align)
+
+    # Random windows fail the byte statistics by chance, so a stretch only
+    # ends at two failing windows in a row that don't overlap.
+    starts = re.compile(b"[^\\x00]")
+    ends = re.compile(
+        b"\\x00.{%d}\\x00" % ((minsize - 1) // align), re.DOTALL
+    )
+
+    runs = b"(?:[^\\x00]|\\x00(?!\\x00)){%d,}" % (minsize - 1)
+    for run in re.finditer(runs, delta):
+        start, end = run.start(), run.end() + 1
+        idx, last = -(-start // align), (end - minsize) // align + 1
+        while True:
+            entry = starts.search(likely, idx, last)
+            if not entry:
+                break
+
+            idx, off = entry.start() + 1, entry.start() * align
+            for size in reversed(sizes):
+                if off + size <= end and _random(buf, off, size, sums, step):
+                    key = buf[off:off+size]
+                    yield Candidate(offset + off, "raw", None, key)
+                    entry = ends.search(likely, idx, last)
+                    idx = entry.start() if entry else last
+                    break
+
+def harvest(buf, offset=0, sizes=(16, 24, 32), align=8, raw=True):
+    """Finds key candidates in a buffer in a single regex pass: CryptoAPI
+    key blobs, PEM and DER encoded RSA keys, and, with raw set, the largest
+    key-sized window that looks random at the start of each stretch of
+    random looking data, see _raw(), leaving out those within one of the
+    other keys. Returns a list of Candidate objects
+    with addresses relative to offset."""
+    ret, covered = [], []
+    for entry in regex.finditer(buf):
+        start, type_ = entry.start(), entry.lastgroup
+
+        # E.g., the PKCS#1 public key within a SubjectPublicKeyInfo.
+        if covered and covered[-1][1] > start:
+            continue
+
+        if type_ == "blob":
+            key = _blob(buf, start)
+        elif type_ == "der":
+            key = _der(buf, start)
+        else:
+            key = _import_rsa(entry.group())
+            key = key and ("RSA", key, len(entry.group()))
+
+        if key:
+            ret.append(Candidate(offset + start, type_, key[0], key[1]))
+            covered.append((start, start + key[2]))
+
+    if raw:
+        starts = [start for start, _ in covered]
+        for candidate in _raw(buf, offset, sorted(sizes), align):
+            off = candidate.addr - offset
+            idx = bisect.bisect_right(starts, off + len(candidate.key) - 1)
+            if idx and covered[idx-1][1] > off:
+                continue
+            ret.append(candidate)
+    return sorted(ret, key=lambda x: x.addr)
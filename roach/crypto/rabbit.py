@@ -2,10 +2,10 @@
 # This file is part of Roach - https://github.com/jbremer/roach.
 # See the file 'docs/LICENSE.txt' for copying permission.
 
-from builtins import range
+from builtins import int, range
 import struct
 
-from roach.crypto.xor import xor
+from roach.native import rabbit as native
 
 def rotl(v,n):
     return (((v<<n)&0xffffffff) | ((v>>(32-n))&0xffffffff))
@@ -24,6 +24,7 @@ class Context(object):
 class Rabbit(object):
     def __init__(self, key, iv):
         self.ctx = Context()
+        self.leftover = b""
         self.set_key(key)
         iv and self.set_iv(iv)
 
@@ -69,6 +70,7 @@ class Rabbit(object):
 
         # Copy master instance to work instance.
         self.ctx.w = self.copy_state(self.ctx.m)
+        self.leftover = b""
 
     def copy_state(self, state):
         s = State()
@@ -94,6 +96,7 @@ class Rabbit(object):
         # Iterate system four times.
         for i in range(4):
             self.next_state(self.ctx.w);
+        self.leftover = b""
 
     def next_state(self, state):
         g = [0]*8
@@ -121,17 +124,91 @@ class Rabbit(object):
             ) & 0xffffffff
             j = (j + 1) & 7
 
+    def blocks(self, count):
+        """Generates count blocks of keystream. This is done by the native
+        component if it's available for this platform. Otherwise it's
+        next_state() and the output extraction inlined with all state kept
+        in locals, which is many times faster than going through
+        next_state()."""
+        s = self.ctx.w
+        if native.rabbit:
+            ret, s.x, s.c, s.carry = native.blocks(s.x, s.c, s.carry, count)
+            return ret
+
+        M, ret = 0xffffffff, []
+        x0, x1, x2, x3, x4, x5, x6, x7 = s.x
+        c0, c1, c2, c3, c4, c5, c6, c7 = s.c
+        carry = int(s.carry)
+
+        for _ in range(count):
+            # Calculate new counter values.
+            c0 = c0 + 0x4D34D34D + carry
+            c1 = c1 + 0xD34D34D3 + (c0 >> 32)
+            c2 = c2 + 0x34D34D34 + (c1 >> 32)
+            c3 = c3 + 0x4D34D34D + (c2 >> 32)
+            c4 = c4 + 0xD34D34D3 + (c3 >> 32)
+            c5 = c5 + 0x34D34D34 + (c4 >> 32)
+            c6 = c6 + 0x4D34D34D + (c5 >> 32)
+            c7 = c7 + 0xD34D34D3 + (c6 >> 32)
+            carry = c7 >> 32
+            c0, c1, c2, c3 = c0 & M, c1 & M, c2 & M, c3 & M
+            c4, c5, c6, c7 = c4 & M, c5 & M, c6 & M, c7 & M
+
+            # Calculate the g-values.
+            g0 = ((x0 + c0) & M) ** 2
+            g1 = ((x1 + c1) & M) ** 2
+            g2 = ((x2 + c2) & M) ** 2
+            g3 = ((x3 + c3) & M) ** 2
+            g4 = ((x4 + c4) & M) ** 2
+            g5 = ((x5 + c5) & M) ** 2
+            g6 = ((x6 + c6) & M) ** 2
+            g7 = ((x7 + c7) & M) ** 2
+            g0, g1 = (g0 ^ g0 >> 32) & M, (g1 ^ g1 >> 32) & M
+            g2, g3 = (g2 ^ g2 >> 32) & M, (g3 ^ g3 >> 32) & M
+            g4, g5 = (g4 ^ g4 >> 32) & M, (g5 ^ g5 >> 32) & M
+            g6, g7 = (g6 ^ g6 >> 32) & M, (g7 ^ g7 >> 32) & M
+
+            # Calculate new state values.
+            x0 = (g0 + (g7 << 16 | g7 >> 16) + (g6 << 16 | g6 >> 16)) & M
+            x1 = (g1 + (g0 << 8 | g0 >> 24) + g7) & M
+            x2 = (g2 + (g1 << 16 | g1 >> 16) + (g0 << 16 | g0 >> 16)) & M
+            x3 = (g3 + (g2 << 8 | g2 >> 24) + g1) & M
+            x4 = (g4 + (g3 << 16 | g3 >> 16) + (g2 << 16 | g2 >> 16)) & M
+            x5 = (g5 + (g4 << 8 | g4 >> 24) + g3) & M
+            x6 = (g6 + (g5 << 16 | g5 >> 16) + (g4 << 16 | g4 >> 16)) & M
+            x7 = (g7 + (g6 << 8 | g6 >> 24) + g5) & M
+
+            ret.append(x0 ^ x5 >> 16 ^ (x3 << 16 & M))
+            ret.append(x2 ^ x7 >> 16 ^ (x5 << 16 & M))
+            ret.append(x4 ^ x1 >> 16 ^ (x7 << 16 & M))
+            ret.append(x6 ^ x3 >> 16 ^ (x1 << 16 & M))
+
+        s.x = [x0, x1, x2, x3, x4, x5, x6, x7]
+        s.c = [c0, c1, c2, c3, c4, c5, c6, c7]
+        s.carry = carry
+        return struct.pack("%dI" % len(ret), *ret)
+
+    def keystream(self, length):
+        """Returns the next length bytes of keystream. Keystream left over
+        from a partial block is used first, so that consecutive calls
+        continue where the previous one left off."""
+        buf = self.leftover
+        if len(buf) < length:
+            buf += self.blocks((length - len(buf) + 15) // 16)
+        self.leftover = buf[length:]
+        return buf[:length]
+
     def encrypt(self, msg):
-        x, ret = [0]*4, []
-        for off in range(0, len(msg) + 15, 16):
-            self.next_state(self.ctx.w)
-            x[0], x[1] = self.ctx.w.x[0], self.ctx.w.x[2]
-            x[2], x[3] = self.ctx.w.x[4], self.ctx.w.x[6]
-            x[0] ^= (self.ctx.w.x[5] >> 16) ^ (self.ctx.w.x[3] << 16) % 2**32
-            x[1] ^= (self.ctx.w.x[7] >> 16) ^ (self.ctx.w.x[5] << 16) % 2**32
-            x[2] ^= (self.ctx.w.x[1] >> 16) ^ (self.ctx.w.x[7] << 16) % 2**32
-            x[3] ^= (self.ctx.w.x[3] >> 16) ^ (self.ctx.w.x[1] << 16) % 2**32
-            ret.append(xor(struct.pack("IIII", *x), msg[off:off+16]))
-        return b"".join(ret)
-
-    decrypt = encrypt
+        """Encrypts (or decrypts) msg. Consecutive calls operate on one
+        continuous stream, i.e., encrypt(a) + encrypt(b) equals
+        encrypt(a + b)."""
+        length = len(msg)
+        ks = self.keystream(length)
+        return (
+            int.from_bytes(msg, "little") ^ int.from_bytes(ks, "little")
+        ).to_bytes(length, "little")
+
+    decrypt = update = encrypt
+
+    def finalize(self):
+        return b""
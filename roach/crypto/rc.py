@@ -2,13 +2,84 @@
 # This file is part of Roach - https://github.com/jbremer/roach.
 # See the file 'docs/LICENSE.txt' for copying permission.
 
+from builtins import int
+import collections
+import threading
+
 from Crypto.Cipher import ARC4
 
 class RC4(object):
+    # Keystream up to this length is cached for rc4() on short buffers.
+    cache_limit = 0x10000
+
+    # Least recently used RC4 objects as returned by RC4.cached().
+    instances = collections.OrderedDict()
+    instances_size = 64
+    instances_lock = threading.Lock()
+
     def __init__(self, key):
-        self.key = key
+        if isinstance(key, str):
+            key = key.encode("utf-8")
+        self.key = bytes(key)
+        self.arc4 = None
+        self.generator = None
+        self.stream = b""
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def cached(key):
+        """Returns a shared RC4 object for a key, so that the key schedule
+        and keystream are reused for repeated use of the same key."""
+        if isinstance(key, str):
+            key = key.encode("utf-8")
+        key = bytes(key)
+
+        with RC4.instances_lock:
+            if key in RC4.instances:
+                RC4.instances.move_to_end(key)
+                return RC4.instances[key]
+
+            ret = RC4.instances[key] = RC4(key)
+            if len(RC4.instances) > RC4.instances_size:
+                RC4.instances.popitem(last=False)
+            return ret
+
+    def keystream(self, length):
+        """Returns the first length bytes of the keystream. The keystream
+        is generated only once and extended as required."""
+        with self.lock:
+            if len(self.stream) < length:
+                if self.generator is None:
+                    self.generator = ARC4.new(self.key)
+                size = max(length - len(self.stream), 0x100)
+                self.stream += self.generator.encrypt(b"\x00" * size)
+            return self.stream[:length]
 
     def rc4(self, data):
-        return ARC4.new(self.key).encrypt(data)
+        """Encrypts (or decrypts) data, starting at the beginning of the
+        keystream for each call."""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+
+        length = len(data)
+        if length > self.cache_limit:
+            return ARC4.new(self.key).encrypt(bytes(data))
+
+        return (
+            int.from_bytes(data, "little") ^
+            int.from_bytes(self.keystream(length), "little")
+        ).to_bytes(length, "little")
 
     encrypt = decrypt = rc4
+
+    def update(self, data):
+        """Encrypts (or decrypts) the next chunk of a stream of data. Unlike
+        rc4(), the keystream continues where the previous call left off."""
+        if self.arc4 is None:
+            self.arc4 = ARC4.new(self.key)
+        if isinstance(data, (bytearray, memoryview)):
+            data = bytes(data)
+        return self.arc4.encrypt(data)
+
+    def finalize(self):
+        return b""
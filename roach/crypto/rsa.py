@@ -2,12 +2,16 @@
 # This file is part of Roach - https://github.com/jbremer/roach.
 # See the file 'docs/LICENSE.txt' for copying permission.
 
-from builtins import int
+from builtins import int, bytes
+import collections
+import hashlib
 import io
+import struct
+import threading
 
 from Crypto.PublicKey.RSA import RSAImplementation
 
-from roach.crypto.winhdr import BLOBHEADER, BaseBlob
+from roach.crypto.winhdr import BaseBlob
 from roach.string.bin import uint32, bigint
 
 class PublicKeyBlob(BaseBlob):
@@ -85,32 +89,79 @@ BlobTypes = {
     7: PrivateKeyBlob,
 }
 
+# BLOBHEADER: bType, bVersion, wReserved, aiKeyAlg.
+BLOBHEADER = "<BBHI"
+
+# Encodings handled by PyCrypto: PEM, DER, and OpenSSH.
+MAGICS = b"-----", b"\x30", b"ssh-rsa "
+
+def _blob_type(data):
+    """Returns the bType of a BLOBHEADER for a RSA key, if any."""
+    size = struct.calcsize(BLOBHEADER)
+    if len(data) < size:
+        return
+
+    type_, _, _, algorithm = struct.unpack(BLOBHEADER, data[:size])
+    if type_ in BlobTypes and algorithm in RSA.algorithms:
+        return type_
+
 class RSA(object):
     algorithms = (
         0x0000a400,  # RSA
     )
 
+    # Least recently imported keys by the SHA1 hash of their data.
+    cache = collections.OrderedDict()
+    cache_size = 256
+    cache_lock = threading.Lock()
+
     @staticmethod
     def import_key(data):
+        """Imports a RSA key in PEM, DER, or OpenSSH format, or from a
+        CryptoAPI PUBLICKEYBLOB or PRIVATEKEYBLOB, and exports it in PEM
+        format. The format is detected up front, so that anything else is
+        rejected before hashing or parsing it. Results for the recognized
+        formats are cached, so that duplicate keys are only parsed once."""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        data = bytes(data)
+
+        type_ = None
+        if not data.startswith(MAGICS):
+            type_ = _blob_type(data)
+            if type_ is None:
+                return
+
+        digest = hashlib.sha1(data).digest()
+        with RSA.cache_lock:
+            if digest in RSA.cache:
+                RSA.cache.move_to_end(digest)
+                return RSA.cache[digest]
+
+        if type_ is None:
+            ret = RSA._import_key(data)
+        else:
+            ret = RSA._import_blob(data, type_)
+
+        with RSA.cache_lock:
+            RSA.cache[digest] = ret
+            if len(RSA.cache) > RSA.cache_size:
+                RSA.cache.popitem(last=False)
+        return ret
+
+    @staticmethod
+    def _import_key(data):
         try:
             return RSA_.importKey(data).exportKey()
         except (ValueError, IndexError):
             pass
 
-        if len(data) < BLOBHEADER.sizeof():
-            return
-
-        buf = io.BytesIO(data)
-        header = BLOBHEADER.parse(buf.read(BLOBHEADER.sizeof()))
-        if header.bType not in BlobTypes:
-            return
-
-        if header.aiKeyAlg not in RSA.algorithms:
-            return
-
-        obj = BlobTypes[header.bType]()
-        obj.parse(buf)
-        return obj.export_key()
+    @staticmethod
+    def _import_blob(data, type_):
+        obj = BlobTypes[type_]()
+        obj.parse(io.BytesIO(data[struct.calcsize(BLOBHEADER):]))
+        if obj.n is not None:
+            return obj.export_key()
 
     @staticmethod
     def export_key(n, e, d=None, p=None, q=None, crt=None):
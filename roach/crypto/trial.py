@@ -0,0 +1,229 @@
+# Copyright (C) 2018 Jurriaan Bremer.
+# This file is part of Roach - https://github.com/jbremer/roach.
+# See the file 'docs/LICENSE.txt' for copying permission.
+
+from builtins import int, bytes, range
+import collections
+import math
+import os
+
+from Crypto.Cipher import ARC4
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+ciphers = {
+    "aes": (algorithms.AES, 16),
+    "des3": (algorithms.TripleDES, 8),
+    "blowfish": (algorithms.Blowfish, 8),
+}
+
+class PKCS7(object):
+    """Checks that the final block of the plaintext holds PKCS7 padding."""
+    where = "tail"
+
+    def __call__(self, buf):
+        count = ord(buf[-1:])
+        return 0 < count <= len(buf) and buf[-count:] == bytes([count])*count
+
+class Magic(object):
+    """Checks that the plaintext holds a magic value at a given offset."""
+    where = "head"
+
+    def __init__(self, value, offset=0):
+        self.value = value
+        self.offset = offset
+
+    def __call__(self, buf):
+        return buf[self.offset:self.offset+len(self.value)] == self.value
+
+class Printable(object):
+    """Checks that the plaintext consists mostly of printable characters,
+    i.e., at least the given fraction of it, as is the case for decrypted
+    strings. Only about 38% of random data is printable."""
+    where = "head"
+
+    chars = bytes(bytearray(range(0x20, 0x7f))) + b"\t\r\n"
+
+    def __init__(self, minimum=0.8):
+        self.minimum = minimum
+
+    def __call__(self, buf):
+        buf = bytes(buf)
+        count = len(buf) - len(buf.translate(None, self.chars))
+        return count >= self.minimum * len(buf)
+
+class Entropy(object):
+    """Checks that the entropy of the plaintext does not exceed the given
+    fraction of the expected entropy of random data of the same length, as
+    random-looking output is the result of a wrong key. Note that for short
+    plaintexts, e.g., 16 bytes, even text may be as entropic as random data,
+    in which case Printable() is a better fit."""
+    where = "head"
+
+    expected = {}
+
+    def __init__(self, maximum=0.8):
+        self.maximum = maximum
+
+    @staticmethod
+    def random(length):
+        """Returns the expected entropy, in bits per byte, of length random
+        bytes. Each byte value occurs k times with a binomial probability
+        and then contributes (k / length) * log2(length / k)."""
+        if length not in Entropy.expected:
+            ret, prob = 0, (255 / 256.0) ** length
+            for count in range(1, length + 1):
+                prob *= (length - count + 1) / (count * 255.0)
+                ret += prob * count * math.log(length / count, 2)
+            Entropy.expected[length] = 256 * ret / length
+        return Entropy.expected[length]
+
+    def __call__(self, buf):
+        if len(buf) < 2:
+            return True
+
+        ret = 0
+        for count in collections.Counter(bytearray(buf)).values():
+            ret -= count * math.log(count / len(buf), 2)
+        return ret / len(buf) <= self.maximum * self.random(len(buf))
+
+class Any(object):
+    """Checks that the plaintext passes any of the given head checks."""
+    where = "head"
+
+    def __init__(self, *checks):
+        self.checks = checks
+
+    def __call__(self, buf):
+        return any(check(buf) for check in self.checks)
+
+def _xor(a, b):
+    return (
+        int.from_bytes(a, "little") ^ int.from_bytes(b, "little")
+    ).to_bytes(len(a), "little")
+
+def _cipher(cipher, key, mode, iv):
+    algorithm, _ = ciphers[cipher]
+    if mode == "cbc":
+        mode = modes.CBC(iv)
+    elif mode == "ctr":
+        mode = modes.CTR(iv)
+    else:
+        mode = modes.ECB()
+    return Cipher(
+        algorithm(key), mode, backend=default_backend()
+    ).decryptor()
+
+def _trial(data, keys, cipher, mode, iv, checks, blocks):
+    """Returns the keys that pass all checks. Only the first blocks, and for
+    the tail checks the final block, are decrypted for each key."""
+    _, size = ciphers[cipher]
+    head = data[:blocks*size]
+    if mode == "cbc":
+        tail, prev = data[-size:], (iv + data)[-2*size:-size]
+    else:
+        tail, prev = data[-size:], None
+
+    ret = []
+    for key in keys:
+        try:
+            if mode == "ctr":
+                decrypt = _cipher(cipher, key, mode, iv).update
+            else:
+                decrypt = _cipher(cipher, key, "ecb", None).update
+        except ValueError:
+            continue
+
+        plain = decrypt(head)
+        if mode == "cbc":
+            plain = _xor(plain, (iv + head)[:len(head)])
+        if not all(check(plain) for check in checks["head"]):
+            continue
+
+        if checks["tail"] and mode != "ctr":
+            plain = decrypt(tail)
+            if mode == "cbc":
+                plain = _xor(plain, prev)
+            if not all(check(plain) for check in checks["tail"]):
+                continue
+        ret.append(key)
+    return ret
+
+def trial(data, keys, cipher="aes", mode="cbc", iv=None, checks=None,
+          blocks=1, workers=1):
+    """Tries many candidate keys against one ciphertext. For each key only
+    the first blocks of the ciphertext (and the final block, for checks on
+    the padding) are decrypted and passed through the plausibility checks,
+    which default to PKCS7 padding. As CTR mode has no padding, it requires
+    head checks, e.g., Magic(). Only keys passing all checks are used to
+    decrypt the entire ciphertext. Returns a list of (key, plaintext).
+    With more than one worker, or None for one per CPU, the keys are spread
+    over a process pool."""
+    if cipher not in ciphers:
+        raise RuntimeError("unsupported cipher for trial decryption!")
+
+    _, size = ciphers[cipher]
+    if mode != "ctr" and (not data or len(data) % size):
+        raise RuntimeError("ciphertext must consist of whole blocks!")
+
+    if mode in ("cbc", "ctr") and (not iv or len(iv) != size):
+        raise RuntimeError("initialization vector must be a single block!")
+
+    data = bytes(data)
+    keys = list(collections.OrderedDict.fromkeys(bytes(key) for key in keys))
+
+    checks_ = {"head": [], "tail": []}
+    for check in (PKCS7(),) if checks is None else checks:
+        checks_[check.where].append(check)
+
+    # Without padding every key would pass, so the plaintext needs to be
+    # checked some other way, e.g., for a magic value.
+    if mode == "ctr" and not checks_["head"]:
+        raise RuntimeError("ctr mode requires checks on the plaintext head!")
+
+    if workers == 1 or len(keys) < 2:
+        winners = _trial(data, keys, cipher, mode, iv, checks_, blocks)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        count = (workers or os.cpu_count() or 1) * 4
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [
+                pool.submit(
+                    _trial, data, keys[idx::count], cipher, mode, iv,
+                    checks_, blocks
+                )
+                for idx in range(count)
+            ]
+            winners = set()
+            for future in futures:
+                winners.update(future.result())
+        winners = [key for key in keys if key in winners]
+
+    ret = []
+    for key in winners:
+        decryptor = _cipher(cipher, key, mode, iv)
+        ret.append((key, decryptor.update(data) + decryptor.finalize()))
+    return ret
+
+def trial_rc4(data, keys, checks=None, length=16):
+    """Tries many candidate RC4 keys against one ciphertext. For each key
+    only the first length bytes are decrypted and passed through the
+    plausibility checks, which default to either mostly printable text, as
+    for encrypted strings, or low entropy. Only keys passing all checks are
+    used to decrypt the entire ciphertext. Returns a list of (key,
+    plaintext)."""
+    checks = [Any(Printable(), Entropy())] if checks is None else list(checks)
+    if any(check.where != "head" for check in checks):
+        raise RuntimeError("rc4 trial decryption only supports head checks!")
+
+    data, ret = bytes(data), []
+    head = data[:length]
+    for key in collections.OrderedDict.fromkeys(bytes(key) for key in keys):
+        if not key or len(key) > 256:
+            continue
+
+        plain = ARC4.new(key).encrypt(head)
+        if all(check(plain) for check in checks):
+            ret.append((key, ARC4.new(key).encrypt(data)))
+    return ret
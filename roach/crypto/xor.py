@@ -2,24 +2,166 @@
 # This file is part of Roach - https://github.com/jbremer/roach.
 # See the file 'docs/LICENSE.txt' for copying permission.
 
-from builtins import int, bytes
-from Crypto.Cipher import XOR
+from builtins import int, bytes, range
 
-def xor(key, data):
-    if not isinstance(data, bytes):
+_tables = {}
+
+def _table(key):
+    if key not in _tables:
+        _tables[key] = bytes(bytearray(x ^ key for x in range(256)))
+    return _tables[key]
+
+def _data(data):
+    if not isinstance(data, (bytes, bytearray, memoryview)):
         raise RuntimeError("data value must be a string!")
+    return data
 
+def _key(key):
     # Retro compatiblity with Python2 (key is used as it is)
-    if isinstance(key, int) and isinstance(data, bytes):
+    if isinstance(key, int):
         key = bytes([key])
     elif isinstance(key, str):
         try:
             key = key.encode("utf-8")
         except UnicodeDecodeError as e:
             print("Warning, a string can't be decoded as UTF-8 using xor() function")
+    return bytes(key)
+
+def _xor(data, stream):
+    """Xors data with an equally long keystream as two big integers."""
+    length = len(data)
+    return (
+        int.from_bytes(data, "little") ^ int.from_bytes(stream, "little")
+    ).to_bytes(length, "little")
+
+def _repeat(key, length):
+    return (key * (length // len(key) + 1))[:length]
+
+def xor(key, data):
+    """Xors data with a (repeating) key. Single-byte keys are applied
+    through a translation table, longer keys through one big integer xor.
+    Data may be bytes, a bytearray, or a memoryview."""
+    data, key = _data(data), _key(key)
+    if not key:
+        raise RuntimeError("xor key must not be empty!")
+
+    if len(key) == 1:
+        return bytes(data).translate(_table(ord(key)))
+    return _xor(data, _repeat(key, len(data)))
+
+def xor_inc(key, data, step=1):
+    """Xors data with a single-byte key that is incremented by step after
+    every byte, i.e., data[i] ^ ((key + i * step) & 0xff)."""
+    data = _data(data)
+    stream = bytes(bytearray((key + idx * step) & 0xff for idx in range(256)))
+    return _xor(data, _repeat(stream, len(data)))
+
+def xor_rolling(key, data):
+    """Reverses a rolling xor, in which every byte has been xor'ed with
+    the previous encrypted byte and the first byte with key, i.e.,
+    data[i] ^ data[i-1]."""
+    data = _data(data)
+    if not data:
+        return b""
+    return _xor(data, _key(key)[-1:] + bytes(data[:-1]))
+
+def xor_brute(data, check, keys=None):
+    """Tries all single-byte keys, or the given candidate keys, against
+    data. check is either the known plaintext that the result should start
+    with, e.g., b"MZ", or a callable that scores the result. Returns a list
+    of (score, key, result), best first, leaving out results that don't
+    start with the known plaintext or that score zero."""
+    data = _data(data)
+    if keys is None:
+        keys = range(256)
+
+    ret = []
+    if isinstance(check, bytes):
+        # Only decrypt what's needed to compare against the known
+        # plaintext and only decrypt the entire buffer for keys that match.
+        head = data[:len(check)]
+        for key in keys:
+            if xor(key, head) == check:
+                ret.append((1, key, xor(key, data)))
+        return ret
+
+    for key in keys:
+        result = xor(key, data)
+        score = check(result)
+        if score:
+            ret.append((score, key, result))
+    return sorted(ret, key=lambda x: x[0], reverse=True)
+
+def xor_search(data, needle, keys=None):
+    """Searches for needle xor'ed with any single-byte key, or any of the
+    given (multi-byte) candidate keys. As in xor_find(), the data is xor'ed
+    with itself shifted by the key length, which cancels out the key, so
+    that it takes a single pass for each distinct key length rather than
+    for each key. Multi-byte keys are found regardless of their phase, i.e.,
+    where the repetition of the key started relative to the hit. Returns a
+    list of (offset, key) for each hit, with the key as it was given."""
+    data, needle = _data(data), _key(needle)
+    if keys is None:
+        keys = range(256)
+
+    # All rotations of each key, grouped by key length.
+    lengths = {}
+    for key in keys:
+        key_ = _key(key)
+        rotations = lengths.setdefault(len(key_), {})
+        for idx in range(len(key_)):
+            rotations.setdefault(key_[idx:] + key_[:idx], key)
+
+    ret, length = [], len(needle)
+    for keylen, rotations in sorted(lengths.items()):
+        if not keylen:
+            continue
+
+        # Too short a needle to cancel out the key, so each (rotation of
+        # a) key is searched for on its own.
+        if keylen >= length:
+            buf, needles = bytes(data), {}
+            for stream, key in rotations.items():
+                needles.setdefault(_xor(needle, stream[:length]), key)
+            for encrypted, key in needles.items():
+                start = buf.find(encrypted)
+                while start != -1:
+                    ret.append((start, key))
+                    start = buf.find(encrypted, start + 1)
+            continue
 
+        value = int.from_bytes(data, "little")
+        delta = _xor(needle[keylen:], needle[:-keylen])
+        shifted = (value ^ value >> 8 * keylen).to_bytes(len(data), "little")
+        start = shifted.find(delta)
+        while start != -1 and start + length <= len(data):
+            stream = _xor(data[start:start+keylen], needle[:keylen])
+            if stream in rotations:
+                ret.append((start, rotations[stream]))
+            start = shifted.find(delta, start + 1)
+    return sorted(ret, key=lambda x: x[0])
 
-    if isinstance(data, str):
-        data = bytes(data)
+def xor_find(data, plaintext, maxlen=None, offset=0):
+    """Finds all copies of a known plaintext that have been xor'ed with a
+    repeating key of 1 up to maxlen bytes. Rather than trying keys, the
+    data is xor'ed with itself shifted by the key length, which cancels out
+    the key, and searched for the plaintext xor'ed with itself likewise.
+    Returns a list of (offset, key) with the key aligned to the offset.
+    Plain copies of the plaintext, i.e., an all-zero key, are left out."""
+    data, plaintext = _data(data), _key(plaintext)
+    length = len(plaintext)
+    if maxlen is None:
+        maxlen = max(length // 2, 1)
+    maxlen = min(maxlen, length - 1)
 
-    return XOR.new(key).decrypt(data)
+    value, found = int.from_bytes(data, "little"), {}
+    for keylen in range(1, maxlen + 1):
+        delta = _xor(plaintext[keylen:], plaintext[:-keylen])
+        shifted = (value ^ value >> 8 * keylen).to_bytes(len(data), "little")
+        start = shifted.find(delta)
+        while start != -1 and start + length <= len(data):
+            key = _xor(data[start:start+keylen], plaintext[:keylen])
+            if start not in found and key.strip(b"\x00"):
+                found[start] = key
+            start = shifted.find(delta, start + 1)
+    return sorted((offset + start, key) for start, key in found.items())
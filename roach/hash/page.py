@@ -0,0 +1,51 @@
+# Copyright (C) 2018 Jurriaan Bremer.
+# This file is part of Roach - https://github.com/jbremer/roach.
+# See the file 'docs/LICENSE.txt' for copying permission.
+
+import sqlite3
+
+class PageIndex(object):
+    """Local on-disk index of page hashes, e.g., of pages that have already
+    been analysed, backed by SQLite."""
+
+    def __init__(self, filepath=":memory:"):
+        self.db = sqlite3.connect(filepath, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS pages (hash BLOB PRIMARY KEY) "
+            "WITHOUT ROWID"
+        )
+
+    def add(self, digests):
+        """Adds one or more page hashes to the index."""
+        if isinstance(digests, bytes):
+            digests = [digests]
+
+        with self.db:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO pages (hash) VALUES (?)",
+                ((digest,) for digest in digests)
+            )
+
+    def unseen(self, digests):
+        """Returns the set of page hashes not yet present in the index."""
+        digests, ret = list(set(digests)), set()
+        for idx in range(0, len(digests), 500):
+            chunk = digests[idx:idx+500]
+            ret.update(chunk)
+            ret.difference_update(row[0] for row in self.db.execute(
+                "SELECT hash FROM pages WHERE hash IN (%s)" % (
+                    ", ".join("?" * len(chunk))
+                ), chunk
+            ))
+        return ret
+
+    def __contains__(self, digest):
+        return self.db.execute(
+            "SELECT 1 FROM pages WHERE hash = ?", (digest,)
+        ).fetchone() is not None
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,83 @@
+/*
+ * Copyright (C) 2018 Jurriaan Bremer.
+ * This file is part of Roach - https://github.com/jbremer/roach.
+ * See the file 'docs/LICENSE.txt' for copying permission.
+ *
+ * Rabbit keystream generator (RFC 4503) used by roach.native.rabbit. It has
+ * no dependencies and is built as follows.
+ *
+ *   gcc -ffreestanding -O2 -fPIC -shared -nostdlib -s \
+ *       -o rabbit-64.so rabbit.c
+ *   gcc -m32 -ffreestanding -O2 -fPIC -shared -nostdlib -s \
+ *       -o rabbit-32.so rabbit.c
+ */
+
+#include <stddef.h>
+#include <stdint.h>
+
+#if defined(_WIN32)
+#define EXPORT __declspec(dllexport)
+#else
+#define EXPORT __attribute__((visibility("default")))
+#endif
+
+static uint32_t rotl(uint32_t v, int n)
+{
+    return v << n | v >> (32 - n);
+}
+
+static uint32_t g_func(uint32_t x)
+{
+    uint64_t square = (uint64_t) x * x;
+    return (uint32_t) (square ^ square >> 32);
+}
+
+/*
+ * Advances the state (x, c, carry) count times and writes 16 bytes of
+ * little-endian keystream to out for each iteration.
+ */
+EXPORT void rabbit_blocks(
+    uint32_t *x, uint32_t *c, uint32_t *carry, uint8_t *out, size_t count)
+{
+    static const uint32_t a[8] = {
+        0x4D34D34D, 0xD34D34D3, 0x34D34D34, 0x4D34D34D,
+        0xD34D34D3, 0x34D34D34, 0x4D34D34D, 0xD34D34D3,
+    };
+    uint32_t g[8], s[4], b = *carry;
+    size_t idx;
+    int i, j;
+
+    for (idx = 0; idx < count; idx++) {
+        for (i = 0; i < 8; i++) {
+            uint64_t t = (uint64_t) c[i] + a[i] + b;
+            c[i] = (uint32_t) t;
+            b = (uint32_t) (t >> 32);
+        }
+
+        for (i = 0; i < 8; i++) {
+            g[i] = g_func(x[i] + c[i]);
+        }
+
+        x[0] = g[0] + rotl(g[7], 16) + rotl(g[6], 16);
+        x[1] = g[1] + rotl(g[0], 8) + g[7];
+        x[2] = g[2] + rotl(g[1], 16) + rotl(g[0], 16);
+        x[3] = g[3] + rotl(g[2], 8) + g[1];
+        x[4] = g[4] + rotl(g[3], 16) + rotl(g[2], 16);
+        x[5] = g[5] + rotl(g[4], 8) + g[3];
+        x[6] = g[6] + rotl(g[5], 16) + rotl(g[4], 16);
+        x[7] = g[7] + rotl(g[6], 8) + g[5];
+
+        s[0] = x[0] ^ x[5] >> 16 ^ x[3] << 16;
+        s[1] = x[2] ^ x[7] >> 16 ^ x[5] << 16;
+        s[2] = x[4] ^ x[1] >> 16 ^ x[7] << 16;
+        s[3] = x[6] ^ x[3] >> 16 ^ x[1] << 16;
+
+        for (i = 0; i < 4; i++) {
+            for (j = 0; j < 4; j++) {
+                *out++ = (uint8_t) (s[i] >> (8 * j));
+            }
+        }
+    }
+
+    *carry = b;
+}
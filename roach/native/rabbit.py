@@ -0,0 +1,31 @@
+# Copyright (C) 2018 Jurriaan Bremer.
+# This file is part of Roach - https://github.com/jbremer/roach.
+# See the file 'docs/LICENSE.txt' for copying permission.
+
+import ctypes
+
+from roach.native.common import load_library
+
+try:
+    rabbit = load_library("rabbit", "cdll")
+    rabbit.rabbit_blocks.argtypes = [
+        ctypes.POINTER(ctypes.c_uint32), ctypes.POINTER(ctypes.c_uint32),
+        ctypes.POINTER(ctypes.c_uint32), ctypes.c_char_p, ctypes.c_size_t,
+    ]
+    rabbit.rabbit_blocks.restype = None
+except ImportError as e:
+    rabbit = None
+
+def blocks(x, c, carry, count):
+    """Generates count blocks of Rabbit keystream from the state variables
+    x, the counters c, and the counter carry bit. Returns the keystream and
+    the updated state as (keystream, x, c, carry)."""
+    if not rabbit:
+        raise RuntimeError("rabbit can't be used on your platform!")
+
+    x_ = (ctypes.c_uint32 * 8)(*x)
+    c_ = (ctypes.c_uint32 * 8)(*c)
+    carry_ = ctypes.c_uint32(carry)
+    out = ctypes.create_string_buffer(count * 16)
+    rabbit.rabbit_blocks(x_, c_, ctypes.byref(carry_), out, count)
+    return out.raw, list(x_), list(c_), carry_.value
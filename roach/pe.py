@@ -3,10 +3,10 @@
 # This file is part of Roach - https://github.com/jbremer/roach.
 # See the file 'docs/LICENSE.txt' for copying permission.
 
+import io
 import pefile
-import struct
 
-from roach.procmem import ProcessMemoryPE, ProcessMemory
+from roach.procmem import ProcessMemoryPE, ProcessMemory, ProcessMemoryWriter
 
 class OurSectionStructure(pefile.SectionStructure):
     def get_data(self, start=None, length=None):
@@ -96,21 +96,23 @@ class PE(object):
         except StopIteration:
             pass
 
-def pe2procmem(data):
-    """Translate a PE file into a procmem file."""
+def pe2procmem(data, f=None):
+    """Translate a PE file into a procmem file. The procmem file is streamed
+    to the file object or filepath f if provided and returned otherwise."""
     pe = PE(data)
     imgbase = pe.optional_header.ImageBase
 
-    ret = [
-        struct.pack("QIIII", imgbase, 0x1000, 0, 0, 0),
-        data[:0x1000],
-    ]
+    out = io.BytesIO() if f is None else f
+    w = ProcessMemoryWriter(out)
+    w.region(imgbase, memoryview(data)[:0x1000], size=0x1000)
 
     # TODO This can be a little bit more enterprise.
     for section in pe.sections:
-        ret.append(struct.pack(
-            "QIIII", imgbase + section.VirtualAddress,
-            section.SizeOfRawData, 0, 0, 0
-        ))
-        ret.append(section.get_data())
-    return b"".join(ret)
+        w.region(
+            imgbase + section.VirtualAddress, section.get_data(),
+            size=section.SizeOfRawData
+        )
+    w.close()
+
+    if f is None:
+        return out.getvalue()
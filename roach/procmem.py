@@ -3,10 +3,15 @@
 # See the file 'docs/LICENSE.txt' for copying permission.
 
 from builtins import int
+import array
+import bisect
+import hashlib
+import io
 import mmap
 import os
 import re
 import struct
+import threading
 
 try:
     import lief
@@ -14,8 +19,13 @@ try:
 except ImportError:
     HAVE_LIEF = False
 
+from roach.compression import blocks
+from roach.crypto.aes import find_key_schedules
+from roach.crypto.harvest import harvest
+from roach.crypto.xor import xor_find
 from roach.disasm import disasm
 from roach.string.bin import uint8, uint16, uint32, uint64
+from roach.string.ops import strings as extract_strings
 
 PAGE_READONLY = 0x00000002
 PAGE_READWRITE = 0x00000004
@@ -25,6 +35,13 @@ PAGE_EXECUTE_READ = 0x00000020
 PAGE_EXECUTE_READWRITE = 0x00000040
 PAGE_EXECUTE_WRITECOPY = 0x00000080
 
+MEM_COMMIT = 0x00001000
+MEM_RESERVE = 0x00002000
+MEM_FREE = 0x00010000
+MEM_PRIVATE = 0x00020000
+MEM_MAPPED = 0x00040000
+MEM_IMAGE = 0x01000000
+
 page_access = {
     PAGE_READONLY: "r",
     PAGE_READWRITE: "rw",
@@ -36,6 +53,10 @@ page_access = {
 }
 
 class Region(object):
+    __slots__ = (
+        "addr", "size", "end", "state", "type_", "protect", "offset",
+    )
+
     def __init__(self, addr, size, state, type_, protect, offset):
         self.addr = addr
         self.size = size
@@ -67,19 +88,171 @@ class Region(object):
             self.protect == other.protect
         )
 
+class Span(object):
+    """Virtually contiguous run of regions with matching attributes."""
+
+    __slots__ = (
+        "addr", "size", "end", "state", "type_", "protect", "regions",
+        "addrs",
+    )
+
+    def __init__(self, regions):
+        self.addr = regions[0].addr
+        self.end = regions[-1].end
+        self.size = self.end - self.addr
+        self.state = regions[0].state
+        self.type_ = regions[0].type_
+        self.protect = regions[0].protect
+        self.regions = regions
+        self.addrs = [region.addr for region in regions]
+
+class RegionTable(object):
+    """Compact, column-based alternative to a list of Region objects. Region
+    objects are only instantiated when a region is accessed."""
+
+    def __init__(self):
+        self.addr = array.array("Q")
+        self.size = array.array("I")
+        self.state = array.array("I")
+        self.type_ = array.array("I")
+        self.protect = array.array("I")
+        self.offset = array.array("Q")
+
+    def append(self, addr, size, state, type_, protect, offset):
+        self.addr.append(addr)
+        self.size.append(size)
+        self.state.append(state)
+        self.type_.append(type_)
+        self.protect.append(protect)
+        self.offset.append(offset)
+
+    columns = (
+        ("addr", "Q"), ("offset", "Q"), ("size", "I"), ("state", "I"),
+        ("type_", "I"), ("protect", "I"),
+    )
+
+    def tobytes(self):
+        """Serializes the table column by column."""
+        return b"".join(
+            getattr(self, name).tobytes() for name, _ in self.columns
+        )
+
+    @staticmethod
+    def frombuffer(buf, count):
+        """Deserializes a table as zero-copy views on top of a buffer."""
+        table, buf, offset = RegionTable(), memoryview(buf), 0
+        for name, fmt in RegionTable.columns:
+            length = struct.calcsize(fmt) * count
+            setattr(table, name, buf[offset:offset+length].cast(fmt))
+            offset += length
+        return table
+
+    def __len__(self):
+        return len(self.addr)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[idx] for idx in range(*item.indices(len(self)))]
+
+        return Region(
+            self.addr[item], self.size[item], self.state[item],
+            self.type_[item], self.protect[item], self.offset[item]
+        )
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+def _match(value, wanted):
+    """Matches a region attribute against a value or a list of values."""
+    if wanted is None:
+        return True
+    if isinstance(wanted, (tuple, list, set, frozenset)):
+        return value in wanted
+    return value == wanted
+
+def _readchunks(f, length, chunk_size=0x100000):
+    while length:
+        buf = f.read(min(length, chunk_size))
+        if not buf:
+            break
+        yield buf
+        length -= len(buf)
+
+def _merge_range(ranges, addr, size, gap):
+    if ranges and ranges[-1][0] + ranges[-1][1] + gap >= addr:
+        start = ranges[-1][0]
+        ranges[-1] = start, max(ranges[-1][1], addr + size - start)
+    else:
+        ranges.append((addr, size))
+
+def _diff_ranges(ranges, buf1, buf2, addr, gap):
+    """Appends the changed byte ranges between two equally sized buffers.
+    The buffers are xor'd as big integers, after which the changed bytes
+    are the non-zero bytes in the result."""
+    delta = (
+        int.from_bytes(buf1, "little") ^ int.from_bytes(buf2, "little")
+    ).to_bytes(len(buf1), "little")
+    for entry in re.finditer(b"[^\\x00]+", delta):
+        _merge_range(ranges, addr + entry.start(), len(entry.group()), gap)
+
+def _join(views):
+    return views[0] if len(views) == 1 else memoryview(b"".join(views))
+
+def _regexv_worker(filepath, query, jobs):
+    p, ret = ProcessMemory(filepath), []
+    for addr, offset, size, limit in jobs:
+        for entry in re.finditer(query, p.view(offset, size), re.DOTALL):
+            # Hits in the overlap are picked up by the next chunk.
+            if entry.start() < limit:
+                ret.append(addr + entry.start())
+    return ret
+
+def _findaes(p, jobs):
+    ret = []
+    for addr, offset, size, limit in jobs:
+        for off, key in find_key_schedules(p.view(offset, size)):
+            # Hits in the overlap are picked up by the next chunk.
+            if off < limit:
+                ret.append((addr + off, key))
+    return ret
+
+def _findaes_worker(filepath, jobs):
+    return _findaes(ProcessMemory(filepath), jobs)
+
 class ProcessMemory(object):
     """Wrapper object to operate on process memory dumps."""
 
-    def __init__(self, file_or_filepath, load=True):
+    # Sidecar header: magic, version, dump size, dump mtime, region count.
+    sidecar_header = "=4sIQQQ"
+    sidecar_magic = b"RIDX"
+    sidecar_version = 1
+
+    def __init__(self, file_or_filepath, load=True, compact=False,
+                 sidecar=False):
         if hasattr(file_or_filepath, "read"):
             self.f = file_or_filepath
+            self.filepath = getattr(self.f, "name", None)
             self.is_file = False
         else:
             self.f = open(file_or_filepath, "rb")
+            self.filepath = file_or_filepath
             self.is_file = True
 
+        # Block-compressed dumps are decompressed on the fly.
+        self.compressed = blocks.detect(self.f)
+        if self.compressed:
+            self.f = blocks.BlockFile(self.f)
+
         # By default mmap(2) a non-empty file into memory.
-        if load and self.is_file and os.path.getsize(file_or_filepath):
+        if load and self.is_file and not self.compressed and \
+                os.path.getsize(file_or_filepath):
             if hasattr(mmap, "PROT_READ"):
                 access = mmap.PROT_READ
             elif hasattr(mmap, "ACCESS_READ"):
@@ -90,92 +263,350 @@ class ProcessMemory(object):
                 )
 
             self.m = mmap.mmap(self.f.fileno(), 0, access=access)
+            self.mv = memoryview(self.m)
         else:
             self.m = self.f
+            self.mv = None
 
+        # Unmapped files are read through pread(2) where possible, as it does
+        # not depend on the (shared) file position. Anything else falls back
+        # to a locked seek & read.
+        try:
+            self.fd = self.f.fileno() if hasattr(os, "pread") else None
+        except (AttributeError, OSError, ValueError):
+            self.fd = None
+
+        self.lock = threading.RLock()
         self.load = load
+        self.compact = compact
+
+        # Optional on-disk cache of the parsed regions next to the dump.
+        if not sidecar or not self.is_file:
+            self.sidecar = None
+        elif sidecar is True:
+            self.sidecar = "%s.ridx" % file_or_filepath
+        else:
+            self.sidecar = sidecar
         self._regions = []
+        self._loaded = False
+        self._index = None
+        self._last = None
+        self._spans = None
+
+    def _parse_regions(self):
+        """Parses the region headers one by one, yielding their fields."""
+        offset = 0
+        while True:
+            buf = self.read(offset, 24)
+            if len(buf) != 24:
+                break
+
+            addr, size, state, typ, protect = struct.unpack("QIIII", buf)
+            yield addr, size, state, typ, protect, offset + 24
+            offset += 24 + size
+
+    def iter_regions(self):
+        """Iterates over the regions in this process memory dump. Unless the
+        regions have already been read, the region headers are parsed on
+        demand without keeping them around."""
+        if self._regions:
+            return iter(self._regions)
+        return (Region(*fields) for fields in self._parse_regions())
 
     @property
     def regions(self):
         """Read the defined regions in this process memory dump."""
-        if self._regions:
+        # An empty dump has no regions, but has been read all the same.
+        if self._loaded or self._regions:
             return self._regions
 
-        self.m.seek(0)
-        while True:
-            buf = self.m.read(24)
-            if not buf:
-                break
+        with self.lock:
+            if self._loaded or self._regions:
+                return self._regions
 
-            addr, size, state, typ, protect = struct.unpack("QIIII", buf)
+            table = self._load_sidecar() if self.sidecar else None
+            if table is not None:
+                regions = table if self.compact else list(table)
+            elif self.compact:
+                regions = RegionTable()
+                for fields in self._parse_regions():
+                    regions.append(*fields)
+            else:
+                regions = [
+                    Region(*fields) for fields in self._parse_regions()
+                ]
 
-            self._regions.append(
-                Region(addr, size, state, typ, protect, self.m.tell())
-            )
-            try:
-                self.m.seek(size, os.SEEK_CUR)
-            except ValueError:
-                break
+            if self.sidecar and table is None:
+                self._write_sidecar(regions)
+
+            self._regions = regions
+            self._loaded = True
         return self._regions
 
+    def _sidecar_key(self):
+        st = os.stat(self.filepath)
+        return st.st_size, getattr(st, "st_mtime_ns", int(st.st_mtime * 1e9))
+
+    def _load_sidecar(self):
+        """Loads the region table from the sidecar file if it exists and
+        still belongs to the current state of the dump."""
+        try:
+            with open(self.sidecar, "rb") as f:
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError):
+            return
+
+        length = struct.calcsize(self.sidecar_header)
+        if len(m) < length:
+            return
+
+        magic, version, size, mtime, count = struct.unpack(
+            self.sidecar_header, m[:length]
+        )
+        if magic != self.sidecar_magic or version != self.sidecar_version:
+            return
+
+        if (size, mtime) != self._sidecar_key() or len(m) != length + 32*count:
+            return
+
+        # The sidecar of an empty dump consists of just its header.
+        if not count:
+            return RegionTable()
+        return RegionTable.frombuffer(memoryview(m)[length:], count)
+
+    def _write_sidecar(self, regions):
+        """Writes the region table to the sidecar file. As the sidecar is
+        merely a cache, failing to write it is not considered an error."""
+        if not isinstance(regions, RegionTable):
+            table = RegionTable()
+            for region in regions:
+                table.append(
+                    region.addr, region.size, region.state, region.type_,
+                    region.protect, region.offset
+                )
+            regions = table
+
+        size, mtime = self._sidecar_key()
+        header = struct.pack(
+            self.sidecar_header, self.sidecar_magic, self.sidecar_version,
+            size, mtime, len(regions)
+        )
+
+        # Write to a temporary file first, so that concurrent readers never
+        # observe a partially written sidecar.
+        tmppath = "%s.%d" % (self.sidecar, os.getpid())
+        try:
+            with open(tmppath, "wb") as f:
+                f.write(header)
+                f.write(regions.tobytes())
+            os.replace(tmppath, self.sidecar)
+        except (IOError, OSError):
+            if os.path.exists(tmppath):
+                os.unlink(tmppath)
+
+    def _build_index(self):
+        """Builds sorted lookup tables for address translation. Regions are
+        stored in file order, so the offsets are sorted by definition, but
+        the addresses have to be sorted explicitly."""
+        regions = self.regions
+        if isinstance(regions, RegionTable):
+            addrs, sizes, offsets = regions.addr, regions.size, regions.offset
+        else:
+            addrs = [region.addr for region in regions]
+            sizes = [region.size for region in regions]
+            offsets = [region.offset for region in regions]
+
+        order = sorted(
+            (idx for idx in range(len(addrs)) if sizes[idx]),
+            key=addrs.__getitem__
+        )
+        sorted_addrs = [addrs[idx] for idx in order]
+        if self.compact:
+            order = array.array("L", order)
+            sorted_addrs = array.array("Q", sorted_addrs)
+
+        self._index = sorted_addrs, order, offsets
+        self._last = None
+
+    def _sorted_regions(self):
+        """Yields the non-empty regions in address order."""
+        if self._index is None:
+            self._build_index()
+
+        regions = self.regions
+        for idx in self._index[1]:
+            yield regions[idx]
+
+    def addr_region(self, addr):
+        """Returns the region containing an address."""
+        # Consecutive reads tend to hit the same region over and over again.
+        region = self._last
+        if region is not None and region.addr <= addr < region.end:
+            return region
+
+        if self._index is None:
+            self._build_index()
+
+        addrs, order = self._index[:2]
+        idx = bisect.bisect_right(addrs, addr) - 1
+        if idx >= 0:
+            region = self.regions[order[idx]]
+            if addr < region.end:
+                self._last = region
+                return region
+
+    def offset_region(self, off):
+        """Returns the region containing a physical offset."""
+        if self._index is None:
+            self._build_index()
+
+        idx = bisect.bisect_right(self._index[2], off) - 1
+        if idx >= 0:
+            region = self.regions[idx]
+            if off < region.offset + region.size:
+                return region
+
+    @property
+    def spans(self):
+        """Coalesces virtually adjacent regions with matching attributes into
+        Span objects, in address order."""
+        if self._spans is not None:
+            return self._spans
+
+        spans, run = [], []
+        for region in self._sorted_regions():
+            if run and run[-1].end == region.addr and (
+                    run[-1].state == region.state and
+                    run[-1].type_ == region.type_ and
+                    run[-1].protect == region.protect):
+                run.append(region)
+                continue
+
+            if run:
+                spans.append(Span(run))
+            run = [region]
+
+        if run:
+            spans.append(Span(run))
+
+        self._span_addrs = [span.addr for span in spans]
+        self._spans = spans
+        return spans
+
+    def addr_span(self, addr):
+        """Returns the span containing an address."""
+        spans = self.spans
+        idx = bisect.bisect_right(self._span_addrs, addr) - 1
+        if idx >= 0 and addr < spans[idx].end:
+            return spans[idx]
+
+    def _gather(self, span, addr, length):
+        """Yields views of the regions within a span making up the requested
+        address range."""
+        idx = bisect.bisect_right(span.addrs, addr) - 1
+        for region in span.regions[idx:]:
+            if not length:
+                break
+            l = min(region.end - addr, length)
+            yield self.view(region.offset + addr - region.addr, l)
+            addr, length = addr + l, length - l
+
+    def readspan(self, span):
+        """Returns the contents of a span as a memoryview. This is a
+        zero-copy slice for single-region spans and a single scatter-gather
+        copy otherwise."""
+        return _join(list(self._gather(span, span.addr, span.size)))
+
     def v2p(self, addr):
         """Virtual address to physical offset translation."""
-        for region in self.regions:
-            if addr >= region.addr and addr < region.end:
-                return region.offset + addr - region.addr
+        region = self.addr_region(addr)
+        if region:
+            return region.offset + addr - region.addr
 
     def p2v(self, off):
         """Physical offset to virtual address translation."""
-        for region in self.regions:
-            if off >= region.offset and off < region.offset + region.size:
-                return region.addr + off - region.offset
+        region = self.offset_region(off)
+        if region:
+            return region.addr + off - region.offset
 
     def addr_range(self, addr):
         """Returns a (start, end) range for an address."""
-        for region in self.regions:
-            if addr >= region.addr and addr < region.end:
-                return region.addr, region.size
-
-    def addr_region(self, addr):
-        for region in self.regions:
-            if addr >= region.addr and addr < region.end:
-                return region
+        region = self.addr_region(addr)
+        if region:
+            return region.addr, region.size
 
     def read(self, offset, length):
-        """Read a chunk of memory from the memory dump."""
-        self.m.seek(offset, os.SEEK_SET)
-        return self.m.read(length)
+        """Read a chunk of memory from the memory dump. This does not touch
+        the file position and is therefore safe to use from multiple
+        threads at once."""
+        if self.mv is not None:
+            return self.m[offset:offset+length]
+
+        if self.fd is not None:
+            return os.pread(self.fd, length, offset)
+
+        if self.compressed:
+            return self.f.pread(length, offset)
+
+        with self.lock:
+            self.m.seek(offset, os.SEEK_SET)
+            return self.m.read(length)
+
+    def view(self, offset, length):
+        """Returns a memoryview of a chunk of memory from the memory dump,
+        which is a zero-copy slice when the dump has been mmap(2)'d."""
+        if self.mv is not None:
+            return self.mv[offset:offset+length]
+        return memoryview(self.read(offset, length))
+
+    def viewv(self, addr, length):
+        """Returns a memoryview of a continuous buffer with address and
+        length. Only reads crossing a region boundary are copied."""
+        region = self.addr_region(addr)
+        if region and addr + length <= region.end:
+            return self.view(region.offset + addr - region.addr, length)
+        return memoryview(self.readv(addr, length))
 
     def readv(self, addr, length):
         """Reads a continuous buffer with address and length."""
+        region = self.addr_region(addr)
+        if region and addr + length <= region.end:
+            return self.read(region.offset + addr - region.addr, length)
+
+        span = self.addr_span(addr)
+        if span and addr + length <= span.end:
+            return b"".join(self._gather(span, addr, length))
+
         ret = []
         while length:
-            r = self.addr_range(addr)
-            if not r:
+            region = self.addr_region(addr)
+            if not region:
                 break
-            a, l = r
-            l = min(a + l - addr, length)
-            ret.append(self.read(self.v2p(addr), l))
+            l = min(region.end - addr, length)
+            ret.append(self.read(region.offset + addr - region.addr, l))
             addr, length = addr + l, length - l
         return b"".join(ret)
 
-    def read_until(self, addr, s=None):
-        """Reads a continuous buffer with address until the stop marker."""
-        ret = []
+    def read_until(self, addr, s=None, align=1):
+        """Reads a continuous buffer with address until the stop marker. The
+        buffer is read in growing chunks rather than entire regions, so short
+        strings only require short reads. With align set, the stop marker
+        must be found at a multiple of align bytes from address."""
+        ret, size = bytearray(), 0x100
         while True:
-            r = self.addr_range(addr)
-            if not r:
+            buf = self.readv(addr, size)
+            start = max(0, len(ret) - len(s) + 1) if s else 0
+            ret += buf
+            if s:
+                idx = ret.find(s, start - start % align)
+                while idx >= 0 and idx % align:
+                    idx = ret.find(s, idx + 1)
+                if idx >= 0:
+                    return bytes(ret[:idx])
+            if len(buf) != size:
                 break
-            a, l = r
-            l = a + l - addr
-            buf = self.read(self.v2p(addr), l)
-            if s and s in buf:
-                ret.append(buf[:buf.index(s)])
-                break
-            ret.append(buf)
-            addr = addr + l
-        return b"".join(ret)
+            addr, size = addr + size, min(size * 2, 0x100000)
+        return bytes(ret)
 
     def uint8p(self, offset):
         """Read unsigned 8-bit value at offset."""
@@ -209,32 +640,453 @@ class ProcessMemory(object):
         """Read unsigned 64-bit value at address."""
         return uint64(self.readv(addr, 8))
 
+    def _arrayv(self, addr, count, fmt):
+        size = struct.calcsize(fmt)
+        view = self.viewv(addr, count * size)
+        return view[:len(view) - len(view) % size].cast(fmt)
+
+    def uint8v_array(self, addr, count):
+        """Read an array of unsigned 8-bit values at address."""
+        return self._arrayv(addr, count, "B")
+
+    def uint16v_array(self, addr, count):
+        """Read an array of unsigned 16-bit values at address."""
+        return self._arrayv(addr, count, "H")
+
+    def uint32v_array(self, addr, count):
+        """Read an array of unsigned 32-bit values at address."""
+        return self._arrayv(addr, count, "I")
+
+    def uint64v_array(self, addr, count):
+        """Read an array of unsigned 64-bit values at address."""
+        return self._arrayv(addr, count, "Q")
+
+    def derefv(self, addrs, is64bit=False):
+        """Dereferences a list of pointers, returning the pointer-sized value
+        at each address, or None if it's not mapped. None entries are passed
+        through, so that calls can be chained."""
+        unpack = struct.Struct("Q" if is64bit else "I").unpack_from
+        size = 8 if is64bit else 4
+
+        ret = []
+        for addr in addrs:
+            if addr is None:
+                ret.append(None)
+                continue
+
+            region = self.addr_region(addr)
+            if region and addr + size <= region.end:
+                offset = region.offset + addr - region.addr
+                if self.mv is not None:
+                    ret.append(unpack(self.m, offset)[0])
+                else:
+                    ret.append(unpack(self.read(offset, size))[0])
+                continue
+
+            buf = self.readv(addr, size)
+            ret.append(unpack(buf)[0] if len(buf) == size else None)
+        return ret
+
+    def chasev(self, addrs, offsets, is64bit=False):
+        """Follows a chain of pointers from each of the addresses. For each
+        offset, the pointer at the current address is dereferenced and the
+        offset is added to it, e.g., offsets (0x10, 0) reads [[addr]+0x10].
+        Returns the final address, which itself isn't dereferenced, for
+        each of the addresses, or None where a pointer along the way is null
+        or not mapped."""
+        addrs = list(addrs)
+        for offset in offsets:
+            addrs = [
+                None if not addr else addr + offset
+                for addr in self.derefv(addrs, is64bit)
+            ]
+        return addrs
+
+    def chase(self, addr, offsets, is64bit=False):
+        """Follows a chain of pointers from an address, see chasev()."""
+        return self.chasev([addr], offsets, is64bit)[0]
+
     def asciiz(self, addr):
         """Read a nul-terminated ASCII string at address."""
-        return self.read_until(addr, "\x00")
+        return self.read_until(addr, b"\x00")
+
+    def widez(self, addr):
+        """Read a nul-terminated UTF-16LE string at address."""
+        return self.read_until(addr, b"\x00\x00", 2)
+
+    def strings(self, minlen=4, addr=None, length=None, protect=None,
+                state=None):
+        """Extracts ASCII and UTF-16LE strings from the memory regions in a
+        single pass per region, yielding (address, encoding, string)."""
+        chunks = self.chunksv(addr, length, protect, state)
+        for addr, chunk in chunks:
+            for entry in extract_strings(chunk, minlen, addr):
+                yield entry
 
     def regexp(self, query, offset=0, length=0):
         """Performs a regex on the file, must use mmap(2) loading."""
-        if not self.load:
+        if not self.load or self.compressed:
             raise RuntimeError("can only regex on a file!")
         if offset and length:
-            chunk = self.m[offset:offset+length]
+            chunk = self.view(offset, length)
         else:
             chunk = self.m
         for entry in re.finditer(query, chunk, re.DOTALL):
             yield offset + entry.start()
 
-    def regexv(self, query, addr=None, length=None):
-        """Performs a regex on the file, must use mmap(2) loading."""
-        if addr and length:
-            offset, end = self.v2p(addr), self.v2p(addr + length)
-            length = end - offset
+    def select(self, protect=None, state=None, type_=None, minsize=None,
+               maxsize=None, addr=None, end=None):
+        """Yields the regions matching all of the given filters in address
+        order. The protect, state, and type_ filters accept a value or a list
+        of values; protect also accepts page access flags, e.g., "x" for any
+        executable region. The addr and end filters select regions
+        overlapping with that address range."""
+        for region in self._sorted_regions():
+            if addr is not None and region.end <= addr:
+                continue
+
+            if end is not None and region.addr >= end:
+                continue
+
+            if minsize is not None and region.size < minsize:
+                continue
+
+            if maxsize is not None and region.size > maxsize:
+                continue
+
+            if isinstance(protect, str):
+                access = page_access.get(region.protect & 0xff, "")
+                if not all(ch in access for ch in protect):
+                    continue
+            elif not _match(region.protect, protect):
+                continue
+
+            if not _match(region.state, state):
+                continue
+
+            if not _match(region.type_, type_):
+                continue
+
+            yield region
+
+    def iter_views(self, protect=None, state=None, type_=None, minsize=None,
+                   maxsize=None, addr=None, end=None):
+        """Yields (region, memoryview) pairs for the regions matching all of
+        the given filters, see select()."""
+        regions = self.select(
+            protect, state, type_, minsize, maxsize, addr, end
+        )
+        for region in regions:
+            yield region, self.view(region.offset, region.size)
+
+    def chunksv(self, addr=None, length=None, protect=None, state=None,
+                contiguous=False):
+        """Yields (address, memoryview) pairs for the data of each region in
+        address order, optionally limited to an address range and filtered
+        by protection and state. With contiguous set, virtually adjacent
+        regions are merged into a single (copied) chunk."""
+        start = addr if addr is not None else 0
+        end = start + length if length is not None else None
+
+        chunk_addr = chunk_end = None
+        chunk = []
+        for region in self.select(protect, state, addr=start, end=end):
+            lo = max(region.addr, start)
+            hi = region.end if end is None else min(region.end, end)
+            view = self.view(region.offset + lo - region.addr, hi - lo)
+
+            if not contiguous:
+                yield lo, view
+                continue
+
+            if chunk and chunk_end == lo:
+                chunk.append(view)
+                chunk_end = hi
+                continue
+
+            if chunk:
+                yield chunk_addr, _join(chunk)
+            chunk_addr, chunk_end, chunk = lo, hi, [view]
+
+        if chunk:
+            yield chunk_addr, _join(chunk)
+
+    def regexv(self, query, addr=None, length=None, protect=None, state=None,
+               contiguous=False):
+        """Performs a regex on the memory regions, yielding the address of
+        each hit. Each region is scanned on its own, i.e., matches never span
+        region headers or gaps between regions, unless contiguous is set, in
+        which case virtually adjacent regions are scanned as one."""
+        chunks = self.chunksv(addr, length, protect, state, contiguous)
+        for addr, chunk in chunks:
+            for entry in re.finditer(query, chunk, re.DOTALL):
+                yield addr + entry.start()
+
+    def _tasks(self, regions, chunk_size, overlap):
+        """Splits regions up in (address, offset, size, limit) chunks of
+        chunk_size bytes that overlap by overlap bytes. Small regions are
+        grouped together in order to amortize the per-task overhead of a
+        process pool."""
+        tasks, jobs, total = [], [], 0
+        for region in regions:
+            for off in range(0, region.size, chunk_size):
+                limit = min(chunk_size, region.size - off)
+                size = min(limit + overlap, region.size - off)
+                jobs.append((
+                    region.addr + off, region.offset + off, size, limit
+                ))
+                total += limit
+                if total >= chunk_size:
+                    tasks.append(jobs)
+                    jobs, total = [], 0
+
+        if jobs:
+            tasks.append(jobs)
+        return tasks
+
+    def regexv_parallel(self, query, workers=None, chunk_size=0x1000000,
+                        overlap=0x1000, protect=None, state=None):
+        """Performs a regex on the memory regions, see regexv(), spread over
+        a pool of worker processes. Each worker opens the dump by its
+        filepath, so no memory has to be transferred. Regions are split up
+        in chunks of chunk_size bytes that overlap by overlap bytes, i.e.,
+        matches may not be longer than overlap bytes. Returns a sorted list
+        of addresses."""
+        from concurrent.futures import ProcessPoolExecutor
+
+        if not self.filepath or not os.path.isfile(self.filepath):
+            raise RuntimeError("parallel scanning requires a filepath!")
+
+        tasks = self._tasks(
+            self.select(protect, state), chunk_size, overlap
+        )
+
+        ret = []
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [
+                pool.submit(_regexv_worker, self.filepath, query, jobs)
+                for jobs in tasks
+            ]
+            for future in futures:
+                ret.extend(future.result())
+        return sorted(ret)
+
+    def scanp(self, scanner, offset=0, length=0):
+        """Runs a roach.string.scan.Scanner over the file, returning the
+        offsets of each pattern. The file is searched once per group of
+        patterns sharing a literal prefix, see Scanner. Must use mmap(2)
+        loading."""
+        if not self.load or self.compressed:
+            raise RuntimeError("can only scan a file!")
+        if offset and length:
+            chunk = self.view(offset, length)
         else:
-            offset = length = 0
-        for offset in self.regexp(query, offset, length):
-            addr = self.p2v(offset)
-            if addr:
-                yield addr
+            chunk = self.m
+        return scanner.scan(chunk, offset)
+
+    def scanv(self, scanner, addr=None, length=None, protect=None,
+              state=None, contiguous=False):
+        """Runs a roach.string.scan.Scanner over the memory regions, see
+        regexv(), returning the addresses of each pattern."""
+        ret = dict((ident, []) for ident, _ in scanner.patterns)
+        chunks = self.chunksv(addr, length, protect, state, contiguous)
+        for addr, chunk in chunks:
+            for ident, addrs in scanner.scan(chunk, addr).items():
+                ret[ident].extend(addrs)
+        return ret
+
+    def decryptv(self, cipher, addr, length, f=None, chunk_size=0x100000):
+        """Decrypts length bytes at addr with a streaming cipher, i.e., an
+        object with update() and finalize() such as the decryptors in
+        roach.short, writing the result to the file object f. Memory usage
+        is bounded by chunk_size. Returns the decrypted data if f is None."""
+        ret = io.BytesIO() if f is None else f
+        end = addr + length
+        while addr < end:
+            size = min(chunk_size, end - addr)
+            region = self.addr_region(addr)
+            if not region:
+                break
+            size = min(size, region.end - addr)
+            ret.write(cipher.update(self.viewv(addr, size)))
+            addr += size
+        ret.write(cipher.finalize())
+        if f is None:
+            return ret.getvalue()
+
+    def findxor(self, plaintext, maxlen=None, addr=None, length=None,
+                protect=None, state=None, chunk_size=0x1000000):
+        """Finds copies of a known plaintext xor'ed with a repeating key of 1
+        up to maxlen bytes in the memory regions, see xor_find(), yielding
+        (address, key). Regions are processed in chunks of chunk_size bytes,
+        so that memory usage is bounded for large dumps."""
+        overlap = len(plaintext) - 1
+        chunks = self.chunksv(addr, length, protect, state)
+        for addr, chunk in chunks:
+            for off in range(0, len(chunk), chunk_size):
+                buf = chunk[off:off+chunk_size+overlap]
+                for start, key in xor_find(buf, plaintext, maxlen):
+                    # Hits in the overlap are picked up by the next chunk.
+                    if start < chunk_size:
+                        yield addr + off + start, key
+
+    def findaes(self, protect=None, state=None, workers=1,
+                chunk_size=0x1000000):
+        """Finds expanded AES-128, AES-192, and AES-256 key schedules in the
+        memory regions, see roach.crypto.aes.find_key_schedules(), and
+        returns a sorted list of (address, key). With more than one worker,
+        or None for one per CPU, the regions are spread over a process
+        pool, which requires the dump to be opened by its filepath."""
+        tasks = self._tasks(self.select(protect, state), chunk_size, 0xef)
+        if workers == 1:
+            return sorted(
+                entry for jobs in tasks for entry in _findaes(self, jobs)
+            )
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        if not self.filepath or not os.path.isfile(self.filepath):
+            raise RuntimeError("parallel scanning requires a filepath!")
+
+        ret = []
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [
+                pool.submit(_findaes_worker, self.filepath, jobs)
+                for jobs in tasks
+            ]
+            for future in futures:
+                ret.extend(future.result())
+        return sorted(ret)
+
+    def findkeys(self, addr=None, length=None, protect=None, state=None,
+                 sizes=(16, 24, 32), align=8, raw=True, chunk_size=0x1000000,
+                 overlap=0x4000):
+        """Harvests key candidates from the memory regions, see
+        roach.crypto.harvest.harvest(), yielding Candidate objects in
+        address order. Regions are processed in chunks of chunk_size bytes
+        that overlap by overlap bytes, which bounds the size of a key. Raw
+        candidates are not looked for in regions that aren't writable and
+        are either executable or part of an image, i.e., code, headers,
+        read-only data, and resources, as byte statistics alone can't tell
+        short stretches of code, nor compressed resources, apart from
+        random data."""
+        chunks = self.chunksv(addr, length, protect, state)
+        for addr, chunk in chunks:
+            region = self.addr_region(addr)
+            access = page_access.get(region.protect & 0xff, "")
+            static = "w" not in access and (
+                "x" in access or region.type_ == MEM_IMAGE
+            )
+            for off in range(0, len(chunk), chunk_size):
+                buf = chunk[off:off+chunk_size+overlap]
+                candidates = harvest(buf, 0, sizes, align, raw and not static)
+                for candidate in candidates:
+                    # Hits in the overlap are picked up by the next chunk.
+                    if candidate.addr < chunk_size:
+                        candidate.addr += addr + off
+                        yield candidate
+
+    def diff(self, other, block_size=0x100000, page_size=0x1000, gap=8):
+        """Compares this process memory dump against another one. Regions are
+        matched by address. Their contents are compared in large blocks, and
+        only blocks that differ are narrowed down to the changed pages and
+        from there on to the changed byte ranges. Changed byte ranges that
+        are less than gap bytes apart are merged."""
+        ret = MemoryDiff()
+        theirs = dict((r.addr, r) for r in other._sorted_regions())
+
+        for region in self._sorted_regions():
+            region2 = theirs.pop(region.addr, None)
+            if region2 is None:
+                ret.removed.append(region)
+                continue
+
+            ranges, size = [], min(region.size, region2.size)
+            for off in range(0, size, block_size):
+                length = min(block_size, size - off)
+                buf1 = self.read(region.offset + off, length)
+                buf2 = other.read(region2.offset + off, length)
+                if buf1 == buf2:
+                    continue
+
+                for page in range(0, length, page_size):
+                    end = page + page_size
+                    if buf1[page:end] == buf2[page:end]:
+                        continue
+
+                    _diff_ranges(
+                        ranges, buf1[page:end], buf2[page:end],
+                        region.addr + off + page, gap
+                    )
+
+            if region.size != region2.size:
+                _merge_range(
+                    ranges, region.addr + size,
+                    abs(region.size - region2.size), gap
+                )
+
+            if ranges or region != region2:
+                ret.modified.append((region, region2, ranges))
+
+        ret.new.extend(sorted(theirs.values(), key=lambda r: r.addr))
+        return ret
+
+    def _pagehashes(self, region, page_size, block_size, hashfunc):
+        zero = b"\x00" * page_size
+        zero_digest = hashfunc(zero).digest()
+
+        # Blocks are to consist of whole pages.
+        block_size = max(block_size - block_size % page_size, page_size)
+
+        for off in range(0, region.size, block_size):
+            length = min(block_size, region.size - off)
+            buf = self.read(region.offset + off, length)
+            view = memoryview(buf)
+            for page in range(0, len(buf), page_size):
+                if buf[page:page+page_size] == zero:
+                    digest = zero_digest
+                else:
+                    digest = hashfunc(view[page:page+page_size]).digest()
+                yield region.addr + off + page, digest
+
+    def pagehashes(self, page_size=0x1000, block_size=0x100000,
+                   hashfunc=hashlib.sha1):
+        """Yields (address, digest) for each page in the memory regions.
+        Regions are read in large blocks and zero pages, which are plentiful,
+        are recognized without hashing them."""
+        for region in self._sorted_regions():
+            for entry in self._pagehashes(
+                    region, page_size, block_size, hashfunc):
+                yield entry
+
+    def newpages(self, index, page_size=0x1000, update=True,
+                 hashfunc=hashlib.sha1):
+        """Yields (address, memoryview) for runs of consecutive pages whose
+        hash is not yet present in a roach.hash.page.PageIndex. Unless update
+        is unset, those hashes are added to the index after each region,
+        i.e., pages occurring more than once are only yielded once."""
+        for region in self._sorted_regions():
+            hashes = list(self._pagehashes(
+                region, page_size, 0x100000, hashfunc
+            ))
+            unseen = index.unseen(digest for _, digest in hashes)
+
+            runs = []
+            for addr, digest in hashes:
+                if digest not in unseen:
+                    continue
+
+                end = min(addr + page_size, region.end)
+                if runs and runs[-1][1] == addr:
+                    runs[-1][1] = end
+                else:
+                    runs.append([addr, end])
+
+            for addr, end in runs:
+                yield addr, self.viewv(addr, end - addr)
+
+            if update:
+                index.add(unseen)
 
     def disasmv(self, addr, size):
         return disasm(self.readv(addr, size), addr)
@@ -293,6 +1145,79 @@ class ProcessMemory(object):
         builder.write(filepath)
         return True
 
+class MemoryDiff(object):
+    """Differences between two process memory dumps. Modified regions are
+    listed as (region, other region, [(address, size), ...]) tuples."""
+
+    def __init__(self):
+        self.new = []
+        self.removed = []
+        self.modified = []
+
+    def __bool__(self):
+        return bool(self.new or self.removed or self.modified)
+
+    __nonzero__ = __bool__
+
+class ProcessMemoryWriter(object):
+    """Writes process memory dumps region by region straight to a file, i.e.,
+    without holding the entire dump in memory."""
+
+    def __init__(self, file_or_filepath):
+        if hasattr(file_or_filepath, "write"):
+            self.f = file_or_filepath
+            self.is_file = False
+        else:
+            self.f = open(file_or_filepath, "wb")
+            self.is_file = True
+
+        try:
+            self.offset = self.f.tell()
+        except (AttributeError, IOError, OSError):
+            self.offset = 0
+
+    def region(self, addr, data, state=0, type_=0, protect=0, size=None):
+        """Appends a region. The data may be a bytes-like object or a file
+        object, which is copied over in chunks. If size is given, the data is
+        truncated or padded with zeroes to size bytes."""
+        if hasattr(data, "read"):
+            if size is None:
+                offset = data.tell()
+                size = data.seek(0, os.SEEK_END) - offset
+                data.seek(offset)
+            chunks = _readchunks(data, size)
+        else:
+            data = memoryview(data)
+            if size is None:
+                size = len(data)
+            chunks = [data[:size]]
+
+        self.f.write(struct.pack("QIIII", addr, size, state, type_, protect))
+        region = Region(addr, size, state, type_, protect, self.offset + 24)
+
+        length = 0
+        for chunk in chunks:
+            self.f.write(chunk)
+            length += len(chunk)
+
+        while length < size:
+            chunk = min(size - length, 0x100000)
+            self.f.write(b"\x00" * chunk)
+            length += chunk
+
+        self.offset += 24 + size
+        return region
+
+    def close(self):
+        if self.is_file:
+            self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
 class ProcessMemoryPE(ProcessMemory):
     """Wrapper around ProcessMemory for reading in-memory PE files."""
 
@@ -306,9 +1231,20 @@ class ProcessMemoryPE(ProcessMemory):
         # Upgrade existing ProcessMemory instance.
         if p.__class__ == ProcessMemory:
             self.f = p.f
+            self.filepath = p.filepath
             self.m = p.m
+            self.mv = p.mv
+            self.fd = p.fd
+            self.compressed = p.compressed
+            self.lock = p.lock
             self.load = p.load
+            self.compact = p.compact
+            self.sidecar = p.sidecar
             self._regions = p.regions
+            self._loaded = p._loaded
+            self._index = None
+            self._last = None
+            self._spans = None
         else:
             ProcessMemory.__init__(self, p, load)
 
@@ -23,11 +23,18 @@ class aes(object):
     def decrypt(self, key=None, iv=None, data=None):
         return AES(key, iv, self.mode).decrypt(data)
 
+    def decryptor(self, key=None, iv=None):
+        return AES(key, iv, self.mode)
+
     class _cbc_(object):
         @staticmethod
         def decrypt(key=None, iv=None, data=None):
             return aes("cbc").decrypt(key, iv, data)
 
+        @staticmethod
+        def decryptor(key=None, iv=None):
+            return aes("cbc").decryptor(key, iv)
+
         __call__ = decrypt
 
     cbc = _cbc_()
@@ -37,6 +44,10 @@ class aes(object):
         def decrypt(key=None, data=None):
             return aes("ecb").decrypt(key, None, data)
 
+        @staticmethod
+        def decryptor(key=None):
+            return aes("ecb").decryptor(key, None)
+
         __call__ = decrypt
 
     ecb = _ecb_()
@@ -46,6 +57,10 @@ class aes(object):
         def decrypt(key=None, nonce=None, data=None):
             return aes("ctr").decrypt(key, nonce, data)
 
+        @staticmethod
+        def decryptor(key=None, nonce=None):
+            return aes("ctr").decryptor(key, nonce)
+
         __call__ = decrypt
 
     ctr = _ctr_()
@@ -61,11 +76,18 @@ class des3(object):
     def decrypt(self, key=None, iv=None, data=None):
         return DES3(key, iv, self.mode).decrypt(data)
 
+    def decryptor(self, key=None, iv=None):
+        return DES3(key, iv, self.mode)
+
     class _cbc_(object):
         @staticmethod
         def decrypt(key=None, iv=None, data=None):
             return des3("cbc").decrypt(key, iv, data)
 
+        @staticmethod
+        def decryptor(key=None, iv=None):
+            return des3("cbc").decryptor(key, iv)
+
         __call__ = decrypt
 
     cbc = _cbc_()
@@ -73,10 +95,16 @@ class des3(object):
 class rc4_(object):
     @staticmethod
     def rc4(key, data):
-        return RC4(key).encrypt(data)
+        return RC4.cached(key).encrypt(data)
 
     __call__ = decrypt = encrypt = rc4
 
+    @staticmethod
+    def decryptor(key):
+        return RC4(key)
+
+    encryptor = decryptor
+
 class blowfish_(object):
     @staticmethod
     def decrypt(key, data):
@@ -84,6 +112,10 @@ class blowfish_(object):
 
     __call__ = decrypt
 
+    @staticmethod
+    def decryptor(key):
+        return Blowfish(key)
+
 class rabbit_(object):
     @staticmethod
     def rabbit(key, iv, data):
@@ -91,6 +123,12 @@ class rabbit_(object):
 
     __call__ = rabbit
 
+    @staticmethod
+    def decryptor(key, iv):
+        return Rabbit(key, iv)
+
+    encryptor = decryptor
+
 blowfish = blowfish_()
 rc4 = rc4_()
 rabbit = rabbit_()
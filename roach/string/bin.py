@@ -5,7 +5,7 @@
 from builtins import int
 import struct
 
-from roach.string.ops import Padding, hex, unhex
+from roach.string.ops import Padding
 
 class IntWorker(object):
     fmt = None
@@ -79,8 +79,12 @@ int64 = Int64()
 uint64 = UInt64()
 
 def bigint(s, bitsize):
+    """Converts between a little-endian buffer of bitsize bits and an
+    integer, in either direction."""
     if isinstance(s, int):
-        return Padding.null(unhex("%x" % s)[::-1], int(bitsize / 8))
+        return Padding.null(
+            s.to_bytes((s.bit_length() + 7) // 8, "little"), int(bitsize / 8)
+        )
 
     if len(s) < int(bitsize / 8):
         return
@@ -91,10 +95,9 @@ def bigint(s, bitsize):
         except UnicodeDecodeError as e:
             print("Warning, a string can't be decoded as UTF-8 using bigint() function")
             s = s[:int(bitsize / 8)][::-1]
-    else:
-        s = s[:int(bitsize / 8)][::-1]
+        return int.from_bytes(s, "big")
 
-    return int(hex(s), 16)
+    return int.from_bytes(s[:int(bitsize / 8)], "little")
 
 # TODO Do we need any love on top of this?
 unpack = struct.unpack
@@ -5,10 +5,30 @@
 from builtins import range
 import base64
 import binascii
+import re
+
+_strings = {}
 
 def asciiz(s):
     return s.split(b"\x00")[0]
 
+def strings(s, minlen=4, offset=0):
+    """Extracts ASCII and UTF-16LE strings of at least minlen characters in a
+    single pass, yielding (offset, encoding, string) tuples."""
+    if minlen not in _strings:
+        _strings[minlen] = re.compile(
+            b"([\\t\\x20-\\x7e]{%d,})|((?:[\\t\\x20-\\x7e]\\x00){%d,})" % (
+                minlen, minlen
+            )
+        )
+
+    for entry in _strings[minlen].finditer(s):
+        if entry.group(1) is not None:
+            encoding, string = "ascii", entry.group(1)
+        else:
+            encoding, string = "utf-16le", entry.group(2)
+        yield offset + entry.start(), encoding, string.decode(encoding)
+
 def hex(s):
     return binascii.hexlify(s)
 
@@ -0,0 +1,137 @@
+# Copyright (C) 2018 Jurriaan Bremer.
+# This file is part of Roach - https://github.com/jbremer/roach.
+# See the file 'docs/LICENSE.txt' for copying permission.
+
+from builtins import bytes, range
+import binascii
+import collections
+import re
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:
+    import sre_parse
+    import sre_constants
+
+def hexpattern(signature):
+    """Translates a hex signature with wildcards, e.g., "4d 5a ?? ?? 5?",
+    into a regex pattern."""
+    if isinstance(signature, bytes):
+        signature = signature.decode("latin1")
+
+    signature = "".join(signature.split())
+    if len(signature) % 2:
+        raise RuntimeError("hex signature must consist of whole bytes!")
+
+    ret = []
+    for idx in range(0, len(signature), 2):
+        hi, lo = signature[idx:idx+2]
+        if hi == "?" and lo == "?":
+            ret.append(b".")
+        elif lo == "?":
+            start = int(hi, 16) << 4
+            ret.append(b"[\\x%02x-\\x%02x]" % (start, start + 0xf))
+        elif hi == "?":
+            ret.append(b"[%s]" % b"".join(
+                b"\\x%02x" % (x << 4 | int(lo, 16)) for x in range(16)
+            ))
+        else:
+            ret.append(re.escape(binascii.unhexlify(hi + lo)))
+    return b"".join(ret)
+
+def _prefix(pattern):
+    """Returns the number of single-byte wildcards that every match of a
+    compiled pattern starts with and the literal bytes following them, if
+    any, e.g., (1, b"Z") for ".Z[\\x00-\\x0f]"."""
+    if pattern.flags & re.IGNORECASE:
+        return 0, b""
+
+    skip, ret = 0, bytearray()
+    for op, value in sre_parse.parse(pattern.pattern, pattern.flags):
+        if op is sre_constants.LITERAL:
+            ret.append(value)
+        elif op in (sre_constants.ANY, sre_constants.IN) and not ret:
+            skip += 1
+        else:
+            break
+    return skip, bytes(ret)
+
+class Scanner(object):
+    """Searches for many byte patterns in a buffer. Patterns are identified
+    by the identifier they were added with, which defaults to the order in
+    which they were added. Patterns are grouped by the first few literal
+    bytes they start with, possibly after single-byte wildcards, e.g., hex
+    signatures sharing a function prologue. The buffer is searched once for
+    each group, after which only the candidate offsets are matched against
+    the patterns of the group. So rather than a single pass, the cost is a
+    fast literal search per group, where patterns that start with wildcards
+    form their own groups by the literal that follows, plus a full regex
+    pass for each pattern without a leading literal, e.g., "(A|B)C"."""
+
+    # Length of the literal prefix that patterns are grouped by.
+    prefix_size = 3
+
+    def __init__(self):
+        self.patterns = []
+        self._groups = None
+
+    def add(self, pattern, ident=None):
+        """Adds a regex pattern and returns its identifier."""
+        if ident is None:
+            ident = len(self.patterns)
+
+        if ident in [ident_ for ident_, _ in self.patterns]:
+            raise RuntimeError("duplicate pattern identifier!")
+
+        self.patterns.append((ident, re.compile(pattern, re.DOTALL)))
+        self._groups = None
+        return ident
+
+    def add_hex(self, signature, ident=None):
+        """Adds a hex signature with wildcards, see hexpattern()."""
+        return self.add(hexpattern(signature), ident)
+
+    @property
+    def groups(self):
+        """List of (regex, skip, patterns) with the regex finding candidate
+        offsets, skip bytes ahead, for its patterns. For patterns without a
+        literal the regex is the pattern itself."""
+        if self._groups is not None:
+            return self._groups
+
+        prefixes = collections.OrderedDict()
+        self._groups = []
+        for ident, pattern in self.patterns:
+            skip, prefix = _prefix(pattern)
+            prefix = prefix[:self.prefix_size]
+            if not prefix:
+                self._groups.append((pattern, 0, [(ident, None)]))
+                continue
+            prefixes.setdefault((skip, prefix), []).append((ident, pattern))
+
+        for (skip, prefix), patterns in prefixes.items():
+            # Patterns that are just the literal need no further matching.
+            literals = () if skip else (prefix, re.escape(prefix))
+            patterns = [
+                (ident, None if pattern.pattern in literals else pattern)
+                for ident, pattern in patterns
+            ]
+            regex = re.compile(re.escape(prefix))
+            self._groups.append((regex, skip, patterns))
+        return self._groups
+
+    def scan(self, buf, offset=0):
+        """Returns all offsets at which each pattern matches as a dictionary
+        of identifier to list of offsets, relative to offset. Overlapping
+        matches are all reported."""
+        ret = dict((ident, []) for ident, _ in self.patterns)
+        for regex, skip, patterns in self.groups:
+            search = regex.search
+            entry = search(buf, skip)
+            while entry:
+                start = entry.start() - skip
+                for ident, pattern in patterns:
+                    if pattern is None or pattern.match(buf, start):
+                        ret[ident].append(offset + start)
+                entry = search(buf, entry.start() + 1)
+        return ret
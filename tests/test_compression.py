@@ -2,13 +2,16 @@
 # This file is part of Roach - https://github.com/jbremer/roach.
 # See the file 'docs/LICENSE.txt' for copying permission.
 
+import io
 import pytest
+import tempfile
 import unittest
 import os
 import roach.native.aplib
 
 from pathlib import Path
-from roach import aplib, gzip, base64
+from roach import aplib, gzip, base64, procmem
+from roach.compression import blocks
 from unittest.mock import patch
 from roach.native.common import load_library
 
@@ -69,3 +72,39 @@ def test_gzip():
     assert gzip(
         base64("H4sICCOZt1oCAzEtOQDLSM3JyVcozy/KSQEAhRFKDQsAAAA=")
     ) == b"hello world"
+
+def test_blocks():
+    fd, filepath = tempfile.mkstemp()
+    os.close(fd)
+    blocks.compress("tests/files/dummy.dmp", filepath, block_size=0x400)
+
+    f = blocks.BlockFile(filepath, cache=2)
+    raw = open("tests/files/dummy.dmp", "rb").read()
+    assert f.size == len(raw)
+    assert f.pread(0x1000, 0x3f0) == raw[0x3f0:0x13f0]
+    assert f.pread(0x100, len(raw) - 8) == raw[-8:]
+    assert f.pread(0x100, len(raw) + 8) == b""
+    assert len(f.cache) == 2
+    f.seek(-4, os.SEEK_END)
+    assert f.read() == raw[-4:]
+
+    p = procmem(filepath)
+    assert p.compressed is True
+    assert p.regions == procmem("tests/files/dummy.dmp").regions
+    assert p.readv(0x41410f00, 0x200) == (
+        b"A"*0xf4 + b"X"*4 + b"A"*8 + b"B"*0x100
+    )
+    assert list(p.regexv(b"AB", contiguous=True)) == [0x41410fff]
+    assert p.uint32v(0x42420ffc) == 0x43434343
+
+    with pytest.raises(RuntimeError):
+        list(p.regexp(b"A"))
+
+    buf = io.BytesIO()
+    blocks.compress(io.BytesIO(b"hello world"), buf, block_size=4)
+    assert blocks.BlockFile(io.BytesIO(buf.getvalue())).read() == (
+        b"hello world"
+    )
+
+    with pytest.raises(RuntimeError):
+        blocks.BlockFile(io.BytesIO(b"hello world"))
@@ -4,8 +4,21 @@
 
 import pytest
 
-from roach import aes, blowfish, des3, rc4, rsa, xor, base64, unhex, rabbit
-from roach.crypto.aes import PlaintextKeyBlob
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+from roach import (
+    aes, blowfish, des3, rc4, rsa, xor, base64, unhex, rabbit, pad
+)
+from roach.crypto.rabbit import Rabbit
+from roach.crypto.rc import RC4
+from roach.crypto.trial import (
+    Entropy, Magic, PKCS7, Printable, trial, trial_rc4
+)
+from roach.crypto.xor import xor_brute, xor_inc, xor_rolling, xor_search
+from roach.crypto.aes import (
+    PlaintextKeyBlob, expand_key, find_key_schedules
+)
 from roach.crypto.rsa import PublicKeyBlob, PrivateKeyBlob
 from unittest.mock import Mock, patch
 
@@ -78,6 +91,40 @@ def test_xor():
         assert xor(
             "hi!", "test"
         ) == b"hello world"
+    assert xor(0x41, memoryview(b"\x00\x03")) == b"AB"
+    assert xor(b"ab", bytearray(b"\x00\x00\x00")) == b"aba"
+
+def test_xor_variants():
+    assert xor_inc(0x41, b"\x00"*4) == b"ABCD"
+    assert xor_inc(0xfe, b"\x00"*3, step=2) == b"\xfe\x00\x02"
+    assert xor_inc(0x10, xor_inc(0x10, b"A"*1000)) == b"A"*1000
+    assert xor_rolling(0x41, b"\x09\x6c\x00\x6c\x03") == b"Hello"
+    assert xor_rolling(0x41, b"") == b""
+
+def test_xor_brute():
+    enc = xor(0x37, b"MZ\x90\x00" + b"A"*32)
+    ret = xor_brute(enc, b"MZ")
+    assert ret == [(1, 0x37, b"MZ\x90\x00" + b"A"*32)]
+    assert xor_brute(enc, b"MZ", keys=[1, 2, 3]) == []
+
+    ret = xor_brute(enc, lambda buf: buf.count(b"A"))
+    assert ret[0] == (32, 0x37, b"MZ\x90\x00" + b"A"*32)
+    assert len(ret) == 5 and [x[0] for x in ret[1:]] == [1, 1, 1, 1]
+
+    buf = b"\x00"*16 + xor(0x55, b"This program") + b"\x00"*16
+    assert xor_search(buf, b"This program") == [(16, 0x55)]
+    assert xor_search(buf, b"This program", keys=[0x54]) == []
+    assert xor_search(buf, b"\x00\x00", keys=[0]) == [
+        (x, 0) for x in list(range(15)) + list(range(28, 43))
+    ]
+
+    buf = b"\x00"*16 + xor(b"K3y", b"This program") + b"\x00"*16
+    assert xor_search(buf, b"This program", keys=[b"K3y"]) == [(16, b"K3y")]
+    assert xor_search(buf, b"program", keys=[b"abc", b"K3y"]) == [
+        (21, b"K3y")
+    ]
+    assert xor_search(buf, b"Th", keys=[b"K3y", b"y"]) == [(16, b"K3y")]
+    assert xor_search(buf, b"This program", keys=[b"K3z"]) == []
 
 @patch("roach.crypto.rsa.PublicKeyBlob")
 @patch("roach.crypto.rsa.bigint", side_effect=lambda a, b: None)
@@ -215,6 +262,33 @@ MB4wDQYJKoZIhvcNAQEBBQADDQAwCgIDAQABAgMBAAE=
 -----END PUBLIC KEY-----
 """.strip()
 
+def test_rsa_cache():
+    blob = base64("""
+BgIAAACkAABSU0ExAAQAAAEAAQChEcfAbVoL/jUnFMxI+xsR0zZUvMZ+9pgkLGpaxTiLRP6PZqx8
+lDdwqdb7gC+m5aOz+Uwms6RHrY/xRMYEXopj877qLancMtsiqcpASOYJWxWSgW+gQMJGldwn2H97
+AaHoqFlbn7NW6oNtpz4C7NotiggtVnqLdE8YyNfO6/gEpQ==
+""")
+    key = rsa.import_key(blob)
+    assert key.startswith(b"-----BEGIN PUBLIC KEY-----")
+
+    # Blobs are recognized by their header and never passed to PyCrypto.
+    with patch("roach.crypto.rsa.RSA_") as rsa_:
+        assert rsa.import_key(bytearray(blob)) == key
+        assert rsa.import_key(b"\x06\x02\x00\x00\x00\xa4\x00\x00RSA1") is None
+        assert rsa.import_key(b"random garbage") is None
+        rsa_.importKey.assert_not_called()
+
+    # Repeated imports are served from the cache.
+    with patch("roach.crypto.rsa.RSA._import_blob") as import_blob:
+        assert rsa.import_key(blob) == key
+        import_blob.assert_not_called()
+
+    # Unrecognized data is neither hashed nor cached.
+    with patch("roach.crypto.rsa.hashlib") as hashlib:
+        assert rsa.import_key(b"random garbage") is None
+        assert rsa.import_key(b"\x06\x02\x00\x00\x00\x24\x00\x00") is None
+        hashlib.sha1.assert_not_called()
+
 def test_rabbit():
     key1 = b"".join([
         b"\x00", b"\x00", b"\x00", b"\x00", b"\x00", b"\x00", b"\x00", b"\x00",
@@ -304,3 +378,133 @@ def test_rabbit():
     assert rabbit(key1, iv1, b"\x00"*48) == out4
     assert rabbit(key1, iv2, b"\x00"*48) == out5
     assert rabbit(key1, iv3, b"\x00"*48) == out6
+
+def test_rabbit_stream():
+    key, iv = b"A"*16, b"B"*8
+    buf = bytes(bytearray(range(256))) * 17
+
+    out = Rabbit(key, iv).encrypt(buf)
+    assert Rabbit(key, iv).decrypt(memoryview(out)) == buf
+    assert out[:48] == rabbit(key, iv, buf[:48])
+
+    r = Rabbit(key, iv)
+    assert b"".join(
+        r.encrypt(buf[a:b]) for a, b in (
+            (0, 3), (3, 3), (3, 16), (16, 33), (33, 1000), (1000, len(buf))
+        )
+    ) == out
+
+    # The pure-Python keystream, for platforms without the native component.
+    with patch("roach.native.rabbit.rabbit", None):
+        assert Rabbit(key, iv).encrypt(buf) == out
+        r = Rabbit(key, iv)
+        assert r.encrypt(buf[:33]) + r.encrypt(buf[33:]) == out
+
+def test_streaming():
+    key, iv = b"A"*16, b"B"*16
+    buf = aes.cbc.decrypt(key, iv, b"C"*4096)
+    d = aes.cbc.decryptor(key, iv)
+    assert b"".join(
+        d.update(memoryview(b"C"*4096)[off:off+100])
+        for off in range(0, 4096, 100)
+    ) + d.finalize() == buf
+
+    d = des3.cbc.decryptor(b"A"*8, b"B"*8)
+    assert d.update(b"C"*12) + d.update(b"C"*20) + d.finalize() == (
+        des3.cbc.decrypt(b"A"*8, b"B"*8, b"C"*32)
+    )
+
+    d = blowfish.decryptor(b"blowfish")
+    assert d.update(b"C"*5) + d.update(b"C"*11) + d.finalize() == (
+        blowfish(b"blowfish", b"C"*16)
+    )
+
+    d = rc4.decryptor(b"Secret")
+    assert d.update(b"Attack") + d.update(memoryview(b" at dawn")) == (
+        rc4(b"Secret", b"Attack at dawn")
+    )
+    assert d.finalize() == b""
+
+    d = rabbit.decryptor(b"K"*16, b"I"*8)
+    assert d.update(b"A"*7) + d.update(b"A"*30) + d.finalize() == (
+        rabbit(b"K"*16, b"I"*8, b"A"*37)
+    )
+
+def test_trial():
+    key, iv = b"K"*16, b"I"*16
+    buf = pad(b"MZ" + b"A"*40, 16)
+    enc = Cipher(
+        algorithms.AES(key), modes.CBC(iv), backend=default_backend()
+    ).encryptor()
+    data = enc.update(buf) + enc.finalize()
+
+    keys = [b"%016d" % idx for idx in range(300)] + [key, key, b"short"]
+    assert (key, buf) in trial(data, keys, iv=iv)
+    assert trial(data, keys, iv=iv, checks=[Magic(b"MZ"), PKCS7()]) == [
+        (key, buf),
+    ]
+    assert trial(data, keys, iv=iv, checks=[Entropy()], blocks=2) == [
+        (key, buf),
+    ]
+    assert trial(
+        data, keys, iv=iv, checks=[Magic(b"MZ"), PKCS7()], workers=2
+    ) == [(key, buf)]
+
+    enc = Cipher(
+        algorithms.AES(key), modes.CTR(iv), backend=default_backend()
+    ).encryptor()
+    data_ = enc.update(b"MZ" + b"A"*40) + enc.finalize()
+    assert trial(data_, keys, mode="ctr", iv=iv, checks=[Magic(b"MZ")]) == [
+        (key, b"MZ" + b"A"*40),
+    ]
+    with pytest.raises(RuntimeError):
+        trial(data_, keys, mode="ctr", iv=iv)
+
+    with pytest.raises(RuntimeError):
+        trial(data[:-1], keys, iv=iv)
+    with pytest.raises(RuntimeError):
+        trial(data, keys)
+
+def test_aes_expand_key():
+    # Test vectors from FIPS-197, Appendix A.
+    assert expand_key(unhex("2b7e151628aed2a6abf7158809cf4f3c"))[-16:] == (
+        unhex("d014f9a8c9ee2589e13f0cc8b6630ca6")
+    )
+    assert expand_key(unhex(
+        "8e73b0f7da0e6452c810f32b809079e562f8ead2522c6b7b"
+    ))[-16:] == unhex("e98ba06f448c773c8ecc720401002202")
+    assert expand_key(unhex(
+        "603deb1015ca71be2b73aef0857d77811f352c073b6108d72d9810a30914dff4"
+    ))[-16:] == unhex("fe4890d1e6188d0b046df344706c631e")
+
+    buf = b"\x00"*0x1001 + expand_key(b"A"*16) + b"\x00"*0x1000
+    assert find_key_schedules(buf, 0x1000) == [(0x2001, b"A"*16)]
+    assert find_key_schedules(buf[:0x1001+175]) == []
+    with pytest.raises(RuntimeError):
+        expand_key(b"A"*8)
+
+def test_rc4_cached():
+    assert RC4.cached("Key") is RC4.cached(b"Key")
+    r = RC4(b"Secret")
+    assert r.keystream(4) == rc4(b"Secret", b"\x00"*4)
+    assert r.rc4(b"Attack at dawn") == r.rc4(memoryview(b"Attack at dawn"))
+    assert r.rc4(b"Attack") == rc4("Secret", "Attack at dawn")[:6]
+    assert r.rc4(b"A"*0x20000)[:6] == rc4(b"Secret", b"A"*6)
+
+    data = rc4(b"key2", b"MZ\x90\x00" + b"\x00"*60)
+    keys = [b"key%d" % idx for idx in range(100)] + [b"", b"A"*257]
+    assert trial_rc4(data, keys) == [(b"key2", b"MZ\x90\x00" + b"\x00"*60)]
+    assert trial_rc4(data, keys, [Magic(b"MZ")], 2) == [
+        (b"key2", b"MZ\x90\x00" + b"\x00"*60),
+    ]
+    with pytest.raises(RuntimeError):
+        trial_rc4(data, keys, [PKCS7()])
+
+    # Even 16 bytes of text are as entropic as random data of that length.
+    url = b"http://evil.example.com/gate.php"
+    data = RC4(b"k1").rc4(url)
+    assert not Entropy()(url[:16]) and Printable()(url[:16])
+    assert trial_rc4(data, [b"k0", b"k1"]) == [(b"k1", url)]
+    assert trial_rc4(data, [b"k0", b"k1"], [Entropy()]) == []
+    assert Entropy()(b"A"*32 + bytes(bytearray(range(32))))
+    assert not Entropy()(bytes(bytearray(range(256))))
@@ -80,3 +80,7 @@ def test_pe2procmem():
     assert a.sections[3].get_data() == b.readv(
         b.regions[4].addr, b.regions[4].size
     )
+
+    f = io.BytesIO()
+    assert pe2procmem(open("tests/files/calc.exe", "rb").read(), f) is None
+    assert procmem(io.BytesIO(f.getvalue())).regions == b.regions
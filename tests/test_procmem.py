@@ -4,12 +4,23 @@
 
 import io
 import os
+import random
 import struct
 import tempfile
 import pytest
-from roach.procmem import Region, ProcessMemory, ProcessMemoryPE
+from unittest.mock import patch
+from roach.crypto.aes import expand_key
+from roach.crypto.harvest import Candidate, harvest
+from roach.hash.page import PageIndex
+from roach.procmem import (
+    Region, RegionTable, ProcessMemory, ProcessMemoryPE, ProcessMemoryWriter
+)
 
-from roach import procmem, procmempe, pad, pe, insn, PAGE_READWRITE
+from roach import (
+    aes, base64, rc4, rsa, procmem, procmempe, pad, pe, insn, PAGE_READONLY,
+    PAGE_READWRITE, PAGE_EXECUTE_READ, PAGE_EXECUTE_READWRITE, MEM_COMMIT, MEM_RESERVE,
+    MEM_PRIVATE, MEM_IMAGE, Scanner, sha1, sha256, xor
+)
 
 def test_pprocmem():
     pm = ProcessMemory(open(__file__), load=False)
@@ -128,3 +139,559 @@ def test_mmap():
     os.close(fd)
     assert procmem(filepath).regions == []
     assert procmem(io.BytesIO(b"")).regions == []
+
+def test_region_index():
+    fd, filepath = tempfile.mkstemp()
+    os.write(fd, b"".join((
+        struct.pack("QIIII", 0x402000, 0x10, 0, 0, PAGE_READWRITE),
+        b"B"*0x10,
+        struct.pack("QIIII", 0x401000, 0x10, 0, 0, PAGE_READWRITE),
+        b"A"*0x10,
+        struct.pack("QIIII", 0x403000, 0, 0, 0, PAGE_READWRITE),
+        struct.pack("QIIII", 0x401010, 0x10, 0, 0, PAGE_READWRITE),
+        b"C"*0x10,
+    )))
+    os.close(fd)
+    p = procmem(filepath)
+    assert p.v2p(0x402000) == 24
+    assert p.v2p(0x40100f) == 24*2 + 0x10 + 0xf
+    assert p.v2p(0x401010) == 24*4 + 0x20
+    assert p.v2p(0x402010) is None
+    assert p.v2p(0x400fff) is None
+    assert p.v2p(0x403000) is None
+    assert p.p2v(24) == 0x402000
+    assert p.p2v(24 + 0x10) is None
+    assert p.p2v(24*4 + 0x2f) == 0x40101f
+    assert p.addr_region(0x401005).addr == 0x401000
+    assert p.addr_range(0x401015) == (0x401010, 0x10)
+    assert p.readv(0x401008, 0x10) == b"A"*8 + b"C"*8
+
+def test_viewv():
+    p = procmem("tests/files/dummy.dmp")
+    v = p.viewv(0x41410f00, 0x100)
+    assert isinstance(v, memoryview) and v.obj is p.m
+    assert v.tobytes() == b"A"*0xf4 + b"X"*4 + b"A"*8
+    v = p.viewv(0x41410f00, 0x200)
+    assert v.obj is not p.m
+    assert v == p.readv(0x41410f00, 0x200)
+    assert p.view(p.v2p(0x42420000), 4) == b"CCCC"
+    assert p.viewv(0x1000, 4) == b""
+
+    p = procmem("tests/files/dummy.dmp", False)
+    assert p.viewv(0x41410ff8, 0x10) == b"A"*8 + b"B"*8
+
+def test_concurrent_reads():
+    from concurrent.futures import ThreadPoolExecutor
+
+    def worker(p):
+        return [
+            (p.uint32v(0x41410ffc), p.readv(0x41410ffe, 4), p.uint32v(0x42420000))
+            for _ in range(500)
+        ]
+
+    for p in (
+            procmem("tests/files/dummy.dmp"),
+            procmem("tests/files/dummy.dmp", False),
+            procmem(io.BytesIO(open("tests/files/dummy.dmp", "rb").read())),
+    ):
+        with ThreadPoolExecutor(8) as pool:
+            for results in pool.map(worker, [p]*8):
+                assert set(results) == set([
+                    (0x41414141, b"AABB", 0x43434343),
+                ])
+
+def test_scan():
+    s = Scanner()
+    s.add(b"X{4}A", "xa")
+    s.add(b"AB")
+    s.add(b"\x00\x10\x00\x00")
+    p = procmem("tests/files/dummy.dmp")
+    assert p.scanp(s) == {
+        "xa": [24 + 0xff4],
+        1: [],
+        2: [8, 24*2 + 0x3000 + 8],
+    }
+    assert p.scanv(s) == {
+        "xa": [0x41410ff4],
+        1: [],
+        2: [],
+    }
+    assert p.scanp(s, 24 + 0xff0, 0x20)["xa"] == [24 + 0xff4]
+
+def test_regexv_regions():
+    p = procmem("tests/files/dummy.dmp")
+    assert list(p.regexv(b"AB")) == []
+    assert list(p.regexv(b"AB", contiguous=True)) == [0x41410fff]
+    assert list(p.regexv(b"BC", contiguous=True)) == []
+    assert list(p.regexv(b"\x00\x10\x00\x00")) == []
+    assert list(p.regexv(b"C{16}")) == [0x42420000 + 16*x for x in range(256)]
+    assert list(p.regexv(b"B+", protect=PAGE_READONLY)) == [0x41411000]
+    assert list(p.regexv(b"B+", state=(0, 1))) == []
+    assert list(p.regexv(b"[AB]{4}", 0x41410ffe, 8, contiguous=True)) == [
+        0x41410ffe, 0x41411002,
+    ]
+    assert list(p.regexv(b"B", 0x41412ffe)) == [0x41412ffe, 0x41412fff]
+
+    p = procmem("tests/files/dummy.dmp", False)
+    assert list(p.regexv(b"X+")) == [0x41410ff4]
+
+def test_regexv_parallel():
+    p = procmem("tests/files/dummy.dmp")
+    assert p.regexv_parallel(b"C{16}", 2) == list(p.regexv(b"C{16}"))
+    assert p.regexv_parallel(
+        b"X+A", workers=2, chunk_size=0x100, overlap=8
+    ) == [0x41410ff4]
+    assert p.regexv_parallel(
+        b"[AB]", chunk_size=0x80, protect=PAGE_READONLY
+    ) == list(range(0x41411000, 0x41413000))
+
+    with pytest.raises(RuntimeError):
+        procmem(io.BytesIO(b"")).regexv_parallel(b"A")
+
+def test_regions_compact():
+    p = procmem("tests/files/dummy.dmp")
+    p2 = procmem("tests/files/dummy.dmp", compact=True)
+    assert isinstance(p2.regions, RegionTable)
+    assert p2.regions == p.regions
+    assert p2.regions[-1].to_json() == p.regions[-1].to_json()
+    assert p2.regions[1:] == p.regions[1:]
+    assert p2.readv(0x41410ffe, 4) == b"AABB"
+    assert p2.p2v(p2.v2p(0x42420010)) == 0x42420010
+    assert list(p2.regexv(b"AB", contiguous=True)) == [0x41410fff]
+    assert procmem(io.BytesIO(b""), compact=True).regions == []
+
+    p = procmem("tests/files/dummy.dmp")
+    regions = p.iter_regions()
+    assert next(regions).addr == 0x41410000
+    assert p._regions == []
+    assert [r.addr for r in regions] == [0x41411000, 0x42420000]
+    assert list(p.iter_regions()) == p.regions
+
+    with pytest.raises(AttributeError):
+        p.regions[0].foo = "bar"
+
+def test_sidecar():
+    dirpath = tempfile.mkdtemp()
+    filepath = os.path.join(dirpath, "dummy.dmp")
+    with open(filepath, "wb") as f:
+        f.write(open("tests/files/dummy.dmp", "rb").read())
+
+    p = procmem(filepath, sidecar=True)
+    assert not os.path.exists(filepath + ".ridx")
+    regions = p.regions
+    assert os.path.getsize(filepath + ".ridx") == 32 + 32*3
+
+    p = procmem(filepath, sidecar=True, compact=True)
+    with patch.object(ProcessMemory, "_parse_regions") as parse:
+        assert p.regions == regions
+        assert p.regions.addr.obj is not None
+        assert p.readv(0x41410ffe, 4) == b"AABB"
+        assert not parse.called
+
+    p = procmem(filepath, sidecar=True)
+    with patch.object(ProcessMemory, "_parse_regions") as parse:
+        assert p.regions == regions
+        assert not parse.called
+
+    # The sidecar is invalidated when the dump changes.
+    with open(filepath, "ab") as f:
+        f.write(struct.pack("QIIII", 0x50000000, 4, 0, 0, 0) + b"DDDD")
+    p = procmem(filepath, sidecar=True)
+    assert len(p.regions) == 4
+    assert procmem(filepath, sidecar=True, compact=True).regions == p.regions
+
+    p = procmem(filepath, sidecar=os.path.join(dirpath, "nope", "x.ridx"))
+    assert len(p.regions) == 4
+
+def test_sidecar_empty():
+    dirpath = tempfile.mkdtemp()
+    filepath = os.path.join(dirpath, "empty.dmp")
+    open(filepath, "wb").close()
+
+    assert procmem(filepath, sidecar=True).regions == []
+    assert os.path.getsize(filepath + ".ridx") == 32
+
+    # The header-only sidecar is valid and is read only once.
+    for compact in (False, True):
+        p = procmem(filepath, sidecar=True, compact=compact)
+        with patch.object(ProcessMemory, "_write_sidecar") as write:
+            with patch.object(
+                ProcessMemory, "_load_sidecar", wraps=p._load_sidecar
+            ) as load:
+                assert len(p.regions) == 0
+                assert len(p.regions) == 0
+                assert load.call_count == 1
+            assert not write.called
+
+def test_arrayv():
+    p = procmem("tests/files/dummy.dmp")
+    a = p.uint32v_array(0x41410ff0, 8)
+    assert a.format == "I" and len(a) == 8
+    assert a.tolist() == [
+        0x41414141, 0x58585858, 0x41414141, 0x41414141,
+        0x42424242, 0x42424242, 0x42424242, 0x42424242,
+    ]
+    assert p.uint64v_array(0x41412ff8, 2).tolist() == [0x4242424242424242]
+    assert p.uint16v_array(0x42420ffd, 2).tolist() == [0x4343]
+    assert p.uint8v_array(0x1000, 2).tolist() == []
+    assert p.uint32v_array(0x42420000, 4).obj is p.m
+
+    assert p.derefv([0x41410ff4, 0x41410ffe, 0x41412ffe, 0x1000]) == [
+        0x58585858, 0x42424141, None, None,
+    ]
+    assert p.derefv(p.uint32v_array(0x41410ff0, 1), True) == [None]
+    assert procmem("tests/files/dummy.dmp", False).derefv(
+        [0x41410ff4, 0x42420000], is64bit=True
+    ) == [0x4141414158585858, 0x4343434343434343]
+
+def test_chasev():
+    # A table of pointers to nodes, each holding a pointer to a string.
+    f = io.BytesIO()
+    with ProcessMemoryWriter(f) as w:
+        w.region(0x401000, struct.pack(
+            "<8I", 0x401020, 0x401028, 0x12345678, 0, 0x401030, 0, 0, 0
+        ) + struct.pack(
+            "<6I", 0, 0x402000, 0, 0x402004, 0, 0xdead0000
+        ), size=0x1000)
+        w.region(0x402000, b"foo\x00bar\x00", size=0x1000)
+    p = procmem(io.BytesIO(f.getvalue()))
+
+    table = p.uint32v_array(0x401000, 5)
+    assert p.derefv(table) == [0, 0, None, None, 0]
+    assert p.derefv(p.derefv(table)) == [None]*5
+    assert p.derefv([None, 0x401000]) == [None, 0x401020]
+
+    slots = range(0x401000, 0x401014, 4)
+    assert p.chasev(slots, (4, 0)) == [
+        0x402000, 0x402004, None, None, 0xdead0000,
+    ]
+    assert p.chasev([0x401010, None, 0x401018], [0]) == [
+        0x401030, None, None,
+    ]
+    assert p.chase(0x401000, (4, 0)) == 0x402000
+    assert p.asciiz(p.chase(0x401004, (4, 0))) == b"bar"
+    assert p.chase(0x401000, ()) == 0x401000
+
+def test_strings():
+    fd, filepath = tempfile.mkstemp()
+    os.write(fd, b"".join((
+        struct.pack("QIIII", 0x401000, 0x1000, 0, 0, PAGE_READWRITE),
+        pad.null(b"\x00hello\x00\x00w\x00i\x00d\x00e\x00\x00\x00", 0xffe),
+        b"st",
+        struct.pack("QIIII", 0x402000, 0x1000, 0, 0, PAGE_READWRITE),
+        b"ring\x00" + b"A"*0x800 + b"\x00\x00" + b"B"*0x7f9,
+    )))
+    os.close(fd)
+    p = procmem(filepath)
+    assert p.asciiz(0x401001) == b"hello"
+    assert p.widez(0x401008) == b"w\x00i\x00d\x00e\x00"
+    assert p.widez(0x401007) == b"\x00w\x00i\x00d\x00e"
+    assert p.asciiz(0x401ffe) == b"string"
+    assert p.asciiz(0x402005) == b"A"*0x800
+    assert p.widez(0x402005) == b"A"*0x800
+    assert p.widez(0x402006) == p.readv(0x402006, 0xffa)
+    assert p.asciiz(0x402807) == b"B"*0x7f9
+    assert p.read_until(0x401fff) == b"t" + p.readv(0x402000, 0x1000)
+    assert p.asciiz(0x1000) == b""
+    assert list(p.strings()) == [
+        (0x401001, "ascii", "hello"),
+        (0x401008, "utf-16le", "wide"),
+        (0x402000, "ascii", "ring"),
+        (0x402005, "ascii", "A"*0x800),
+        (0x402807, "ascii", "B"*0x7f9),
+    ]
+    assert list(p.strings(6, 0x401000, 0x1000)) == []
+
+def test_writer():
+    fd, filepath = tempfile.mkstemp()
+    os.close(fd)
+    with ProcessMemoryWriter(filepath) as w:
+        r = w.region(0x41410000, b"A"*0x1000, protect=PAGE_EXECUTE_READWRITE)
+        assert r.offset == 24
+        w.region(0x41411000, io.BytesIO(b"B"*0x2000), 42, 43, PAGE_READONLY)
+        w.region(
+            0x42420000, memoryview(b"C"*0x800), protect=PAGE_READONLY,
+            size=0x1000
+        )
+        w.region(0x50000000, io.BytesIO(b"DDDDEEEE"), size=4)
+
+    p = procmem(filepath)
+    assert p.regions[:3] == procmem("tests/files/dummy.dmp").regions
+    assert p.readv(0x42420000, 0x1000) == b"C"*0x800 + b"\x00"*0x800
+    assert p.readv(0x50000000, 8) == b"DDDD"
+
+    buf = io.BytesIO(b"foo")
+    buf.seek(3)
+    assert ProcessMemoryWriter(buf).region(0x1000, b"hello").offset == 27
+
+def test_spans():
+    f = io.BytesIO()
+    w = ProcessMemoryWriter(f)
+    w.region(0x401000, b"A"*0x1000, protect=PAGE_READWRITE)
+    w.region(0x403000, b"C"*0x1000, protect=PAGE_READWRITE)
+    w.region(0x402000, b"B"*0x1000, protect=PAGE_READWRITE)
+    w.region(0x404000, b"D"*0x1000, protect=PAGE_READONLY)
+    w.region(0x406000, b"E"*0x1000, protect=PAGE_READONLY)
+    p = procmem(io.BytesIO(f.getvalue()))
+
+    assert [(s.addr, s.size, len(s.regions)) for s in p.spans] == [
+        (0x401000, 0x3000, 3), (0x404000, 0x1000, 1), (0x406000, 0x1000, 1),
+    ]
+    assert p.addr_span(0x402fff).addr == 0x401000
+    assert p.addr_span(0x405000) is None
+    assert p.readspan(p.spans[0]) == b"A"*0x1000 + b"B"*0x1000 + b"C"*0x1000
+    assert p.readspan(p.spans[1]) == b"D"*0x1000
+    assert p.readv(0x401fff, 0x1002) == b"A" + b"B"*0x1000 + b"C"
+    assert p.readv(0x403fff, 2) == b"CD"
+    assert p.viewv(0x402ffe, 4) == b"BBCC"
+
+def test_diff():
+    def dump(*regions):
+        f = io.BytesIO()
+        w = ProcessMemoryWriter(f)
+        for addr, data, protect in regions:
+            w.region(addr, data, protect=protect)
+        return procmem(io.BytesIO(f.getvalue()))
+
+    data = bytearray(b"A"*0x3000)
+    a = dump(
+        (0x401000, bytes(data), PAGE_READWRITE),
+        (0x501000, b"B"*0x1000, PAGE_READWRITE),
+        (0x601000, b"C"*0x1000, PAGE_READWRITE),
+        (0x701000, b"D"*0x1000, PAGE_READWRITE),
+    )
+    data[0x10:0x14] = b"XXXX"
+    data[0x16] = 0x58
+    data[0x1ffe:0x2002] = b"YYYY"
+    data[0x2800] = 0x5a
+    b = dump(
+        (0x401000, bytes(data), PAGE_READWRITE),
+        (0x501000, b"B"*0x1000, PAGE_READONLY),
+        (0x701000, b"D"*0x2000, PAGE_READWRITE),
+        (0x801000, b"E"*0x1000, PAGE_READWRITE),
+    )
+
+    assert not a.diff(a)
+    d = a.diff(b, block_size=0x2000, gap=2)
+    assert [r.addr for r in d.new] == [0x801000]
+    assert [r.addr for r in d.removed] == [0x601000]
+    assert [(r.addr, r2.addr, ranges) for r, r2, ranges in d.modified] == [
+        (0x401000, 0x401000, [
+            (0x401010, 7), (0x402ffe, 4), (0x403800, 1),
+        ]),
+        (0x501000, 0x501000, []),
+        (0x701000, 0x701000, [(0x702000, 0x1000)]),
+    ]
+    assert a.diff(b, gap=0).modified[0][2][:2] == [
+        (0x401010, 4), (0x401016, 1),
+    ]
+
+def test_pagehashes():
+    f = io.BytesIO()
+    w = ProcessMemoryWriter(f)
+    w.region(0x401000, b"A"*0x1000 + b"\x00"*0x1000 + b"B"*0x1000)
+    w.region(0x501000, b"A"*0x1000 + b"C"*0x800)
+    p = procmem(io.BytesIO(f.getvalue()))
+
+    hashes = list(p.pagehashes())
+    assert hashes == [
+        (0x401000, sha1(b"A"*0x1000)),
+        (0x402000, sha1(b"\x00"*0x1000)),
+        (0x403000, sha1(b"B"*0x1000)),
+        (0x501000, sha1(b"A"*0x1000)),
+        (0x502000, sha1(b"C"*0x800)),
+    ]
+    assert list(p.pagehashes(block_size=0x800)) == hashes
+
+    index = PageIndex()
+    index.add(sha1(b"\x00"*0x1000))
+    assert sha1(b"\x00"*0x1000) in index
+    assert [(addr, len(view)) for addr, view in p.newpages(index)] == [
+        (0x401000, 0x1000), (0x403000, 0x1000), (0x502000, 0x800),
+    ]
+    assert len(index) == 4
+    assert list(p.newpages(index)) == []
+
+    fd, filepath = tempfile.mkstemp()
+    os.close(fd)
+    index = PageIndex(filepath)
+    index.add([sha1(b"B"*0x1000), sha1(b"C"*0x800)])
+    index.close()
+    index = PageIndex(filepath)
+    assert index.unseen([sha1(b"B"*0x1000), b"foo"]) == set([b"foo"])
+    assert [addr for addr, _ in p.newpages(index, update=False)] == [
+        0x401000, 0x501000,
+    ]
+    assert len(index) == 2
+
+def test_select():
+    f = io.BytesIO()
+    w = ProcessMemoryWriter(f)
+    w.region(0x401000, b"A"*0x1000, MEM_COMMIT, MEM_IMAGE, PAGE_EXECUTE_READ)
+    w.region(0x402000, b"B"*0x2000, MEM_COMMIT, MEM_IMAGE, PAGE_READONLY)
+    w.region(0x501000, b"C"*0x1000, MEM_COMMIT, MEM_PRIVATE, PAGE_READWRITE)
+    w.region(
+        0x601000, b"D"*0x3000, MEM_COMMIT, MEM_PRIVATE, PAGE_EXECUTE_READWRITE
+    )
+    w.region(0x701000, b"", MEM_RESERVE, MEM_PRIVATE, PAGE_READWRITE)
+    # PAGE_GUARD modifier on top of PAGE_READWRITE.
+    w.region(
+        0x801000, b"E"*0x1000, MEM_COMMIT, MEM_PRIVATE, PAGE_READWRITE | 0x100
+    )
+    p = procmem(io.BytesIO(f.getvalue()))
+
+    addrs = lambda **kw: [r.addr for r in p.select(**kw)]
+    assert addrs() == [0x401000, 0x402000, 0x501000, 0x601000, 0x801000]
+    assert addrs(protect="x") == [0x401000, 0x601000]
+    assert addrs(protect="rw") == [0x501000, 0x601000, 0x801000]
+    assert addrs(protect=[PAGE_READONLY, PAGE_READWRITE]) == [
+        0x402000, 0x501000,
+    ]
+    assert addrs(type_=MEM_PRIVATE, protect="w") == [
+        0x501000, 0x601000, 0x801000,
+    ]
+    assert addrs(state=MEM_RESERVE) == []
+    assert addrs(minsize=0x2000) == [0x402000, 0x601000]
+    assert addrs(maxsize=0x1000) == [0x401000, 0x501000, 0x801000]
+    assert addrs(addr=0x403fff, end=0x601001) == [
+        0x402000, 0x501000, 0x601000,
+    ]
+
+    views = list(p.iter_views(type_=MEM_PRIVATE, protect="x"))
+    assert len(views) == 1 and views[0][0].addr == 0x601000
+    assert views[0][1] == b"D"*0x3000
+    assert list(p.regexv(b"D+", protect="x")) == [0x601000]
+
+def test_findxor():
+    mz = b"This program cannot be run in DOS mode"
+    f = io.BytesIO()
+    with ProcessMemoryWriter(f) as w:
+        w.region(0x401000, b"\x00"*0x100 + xor(b"K3y", mz), 0, 0, 0, 0x1000)
+        w.region(0x402000, b"A"*0xfff + xor(0x42, mz), 0, 0, 0, 0x2000)
+        w.region(0x501000, mz, 0, 0, 0, 0x1000)
+    p = procmem(io.BytesIO(f.getvalue()))
+    assert list(p.findxor(mz, 4)) == [
+        (0x401100, b"K3y"), (0x402fff, b"B"),
+    ]
+    assert list(p.findxor(mz, 4, chunk_size=0x400)) == [
+        (0x401100, b"K3y"), (0x402fff, b"B"),
+    ]
+    assert list(p.findxor(mz, 2)) == [(0x402fff, b"B")]
+    assert list(p.findxor(mz, addr=0x402000)) == [(0x402fff, b"B")]
+
+def test_decryptv():
+    f = io.BytesIO()
+    with ProcessMemoryWriter(f) as w:
+        w.region(0x401000, b"A"*0x1000)
+        w.region(0x402000, b"B"*0x1000)
+    p = procmem(io.BytesIO(f.getvalue()))
+    data = b"A"*0xf00 + b"B"*0x200
+
+    out = io.BytesIO()
+    assert p.decryptv(
+        rc4.decryptor(b"key"), 0x401100, 0x1100, out, chunk_size=0x300
+    ) is None
+    assert out.getvalue() == rc4(b"key", data)
+
+    d = aes.ctr.decryptor(b"K"*16, b"N"*16)
+    assert p.decryptv(d, 0x401100, 0x1100) == (
+        aes.ctr(b"K"*16, b"N"*16, data)
+    )
+    d = aes.cbc.decryptor(b"K"*16, b"I"*16)
+    assert p.decryptv(d, 0x402f00, 0x200) == (
+        aes.cbc(b"K"*16, b"I"*16, b"B"*0x100)
+    )
+
+def test_findkeys():
+    der = base64(
+        "MIGfMA0GCSqGSIb3DQEBAQUAA4GNADCBiQKBgQC5cagCPVB7LiX3UI5N3WRQJqTLe5R"
+        "PrhFj79/U7AY+ziYQrKhSaIQG7KWuLAZj4sKRyRyZK1te0Ekb1UGkYn3b1YTQtXojaa"
+        "kq5p4WyHFvhfNPjSlJClIt4QC/NZ9uS2FRee8ONEKODrcgevzcd+lbNy/mGAB7yW9Xg"
+        "P06YzfOyQIDAQAB"
+    )
+    blob = b"\x08\x02\x00\x00\x0e\x66\x00\x00\x10\x00\x00\x00" + b"K"*16
+    key = sha256(b"roach")
+
+    f = io.BytesIO()
+    with ProcessMemoryWriter(f) as w:
+        w.region(
+            0x401000, b"\x00"*0x10 + blob + b"A"*0x100 + der, size=0x1000
+        )
+        w.region(0x402000, pad.null(
+            b"B"*0x20 + rsa.import_key(der), 0x200
+        ) + key)
+    p = procmem(io.BytesIO(f.getvalue()))
+
+    pem = rsa.import_key(der)
+    keys = [(c.addr, c.type_, c.algorithm, c.key) for c in p.findkeys()]
+    assert keys == [
+        (0x401010, "blob", "AES-128", b"K"*16),
+        (0x40112c, "der", "RSA", pem),
+        (0x402020, "pem", "RSA", pem),
+        (0x402200, "raw", None, key),
+    ]
+    assert [
+        c.addr for c in p.findkeys(raw=False, chunk_size=0x800)
+    ] == [0x401010, 0x40112c, 0x402020]
+
+def test_findkeys_code():
+    p = procmem("tests/files/calc.dmp")
+    code = p.regions[1]
+    assert code.protect == PAGE_EXECUTE_READ
+    assert not [
+        c for c in p.findkeys(code.addr, code.size) if c.type_ == "raw"
+    ]
+
+    # Nor in the headers, read-only data, and resources of the image.
+    assert set(
+        p.addr_region(c.addr).addr for c in p.findkeys() if c.type_ == "raw"
+    ) == set([0x124000])
+
+    # Byte statistics alone can't rule out all short stretches of code, but
+    # they do rule out nearly all of it, while keeping random keys.
+    buf = p.readv(code.addr, code.size)
+    raw = [c for c in harvest(buf) if c.type_ == "raw"]
+    assert len(raw) < code.size // 8 // 20
+
+    rand = random.Random(1)
+    keys = [
+        bytes(rand.getrandbits(8) for _ in range(size))
+        for size in (16, 24, 32) for _ in range(1000)
+    ]
+    found = [
+        key for key in keys
+        if harvest(b"\x00"*8 + key + b"\x00"*8)[:1] == [
+            Candidate(8, "raw", None, key)
+        ]
+    ]
+    assert len(found) > len(keys) * 0.99
+
+def test_harvest_stretch():
+    rand = random.Random(2)
+    buf = bytes(rand.getrandbits(8) for _ in range(0x10000))
+    raw = harvest(b"\x00"*8 + buf + b"\x00"*8)
+    assert raw[:1] == [Candidate(8, "raw", None, buf[:32])]
+    assert len(raw) < 8
+
+def test_findaes():
+    keys = [
+        b"\x2b\x7e\x15\x16\x28\xae\xd2\xa6\xab\xf7\x15\x88\x09\xcf\x4f\x3c",
+        bytes(bytearray(range(24))),
+        b"K"*32,
+    ]
+
+    fd, filepath = tempfile.mkstemp()
+    os.close(fd)
+    with ProcessMemoryWriter(filepath) as w:
+        w.region(0x401000, b"\x00"*0x1000)
+        w.region(0x402000, b"\x00"*0x104 + expand_key(keys[0]), size=0x1000)
+        w.region(0x410000, pad.null(
+            b"A"*0x7f0 + expand_key(keys[1]) + b"\x00"*0x20 +
+            expand_key(keys[2]), 0x1000
+        ))
+
+    p = procmem(filepath)
+    ret = [(0x402104, keys[0]), (0x4107f0, keys[1]), (0x4108e0, keys[2])]
+    assert p.findaes() == ret
+    assert p.findaes(chunk_size=0x800) == ret
+    assert p.findaes(workers=2, chunk_size=0x400) == ret
@@ -2,14 +2,29 @@
 # This file is part of Roach - https://github.com/jbremer/roach.
 # See the file 'docs/LICENSE.txt' for copying permission.
 
+import binascii
+import random
+
 from roach import (
     int8, uint8, int16, uint16, int32, uint32, int64, uint64, bigint,
-    asciiz, pad, unpad, ipv4, pack, unpack, hex, unhex, base64, uleb128
+    asciiz, pad, unpad, ipv4, pack, unpack, hex, unhex, base64, uleb128,
+    Scanner
 )
+from roach.string.ops import strings
+from roach.string.scan import hexpattern
 
 def test_asciiz():
     assert asciiz(b"hello\x00world") == b"hello"
 
+def test_strings():
+    assert list(strings(
+        b"\x00abc\x00hello\tworld\x00w\x00i\x00d\x00e\x00\x00\x00", 4, 0x10
+    )) == [
+        (0x15, "ascii", "hello\tworld"),
+        (0x21, "utf-16le", "wide"),
+    ]
+    assert list(strings(memoryview(b"abc"), 3)) == [(0, "ascii", "abc")]
+
 def test_hex():
     assert hex(b"hello") == b"68656c6c6f"
     assert unhex("68656c6c6f") == b"hello"
@@ -133,3 +148,50 @@ def test_pack():
     assert unpack("HHIQ", b"A"*16) == (
         0x4141, 0x4141, 0x41414141, 0x4141414141414141
     )
+
+def test_hexpattern():
+    assert hexpattern("4d 5a ?? 2e") == b"MZ.\\."
+    assert hexpattern(b"4?") == b"[\\x40-\\x4f]"
+    assert len(hexpattern("?1")) == 2 + 16*4
+
+def test_scanner():
+    s = Scanner()
+    assert s.scan(b"hello") == {}
+    assert s.add(b"AB") == 0
+    assert s.add_hex("42 ?? 44", "bxd") == "bxd"
+    assert s.add(b"(A|C)+D") == 2
+    assert s.add(b"D") == 3
+    assert s.scan(b"ABCDABxD", 0x100) == {
+        0: [0x100, 0x104],
+        "bxd": [0x101, 0x105],
+        2: [0x102],
+        3: [0x103, 0x107],
+    }
+    assert s.scan(memoryview(b"..AB"))[0] == [2]
+
+    s = Scanner()
+    s.add_hex("?? 41")
+    s.add(b"A.A")
+    assert s.scan(b"AAAA") == {0: [0, 1, 2], 1: [0, 1]}
+
+def test_scanner_groups():
+    # Signatures sharing a function prologue are searched for as a group,
+    # next to a pattern that starts with a wildcard.
+    rand = random.Random(1)
+    buf = bytearray(rand.getrandbits(8) for _ in range(0x10000))
+    s = Scanner()
+    for idx in range(50):
+        sig = b"U\x8b\xec" + bytes(rand.getrandbits(8) for _ in range(6))
+        s.add_hex(binascii.hexlify(sig))
+        offset = rand.randrange(len(buf) - len(sig))
+        buf[offset:offset+len(sig)] = sig
+    s.add_hex("?? 5a 90 ?? 4d")
+    buf = bytes(buf * 4)
+
+    assert len(s.groups) == 2
+    expected = dict(
+        (ident, [entry.start() for entry in pattern.finditer(buf)])
+        for ident, pattern in s.patterns
+    )
+    assert s.scan(buf) == expected
+    assert all(len(expected[idx]) >= 4 for idx in range(50))